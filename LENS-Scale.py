@@ -1,3 +1,12 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+from collections import deque
+
+
 class Category:
     """
     An object representing a single rating category.
@@ -328,9 +337,172 @@ CATEGORY_DEFINITIONS = [
 
 
 
+# --- BATCH (NON-INTERACTIVE) SCORING ---
+# Rows are read lazily, scored in fixed-size chunks and written out as soon as
+# each chunk is done, so memory stays bounded no matter how big the input is.
+# Each row maps category names to ratings; Action may be null, "", or "N".
+# Any other fields (e.g. an id) are passed through, and a "score" field is added.
+
+# Inputs larger than this are spread over all cores when --workers is not given.
+AUTO_POOL_MIN_BYTES = 50 * 1024 * 1024
+
+_worker_rater = None
+
+
+def _get_worker_rater():
+    """Returns this process's MovieRater, built once and reused for every row."""
+    global _worker_rater
+    if _worker_rater is None:
+        _worker_rater = MovieRater(CATEGORY_DEFINITIONS)
+    return _worker_rater
+
+
+def _whole_number(value):
+    """Returns value as an int if it is a whole number (int, integral float or integer string), else None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else None
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            return None
+    return None
+
+
+def score_record(record):
+    """Scores one row (a dict of category name -> rating) and returns the score."""
+    rater = _get_worker_rater()
+    for category in rater.categories:
+        value = record.get(category.name)
+        if category.name == "Action" and (value is None or str(value).strip().lower() in ("", "n")):
+            category.user_rating = None
+            continue
+        rating = _whole_number(value)
+        if rating is None:
+            raise ValueError(f"'{category.name}' must be a whole number, got {value!r}.")
+        if not 1 <= rating <= category.max_score:
+            raise ValueError(f"'{category.name}' must be between 1 and {category.max_score}, got {rating}.")
+        category.user_rating = rating
+    rater.calculate_score()
+    return rater.final_score
+
+
+def score_chunk(task):
+    """
+    Scores one chunk of (line_number, row) pairs. JSONL rows arrive as raw
+    lines so that parsing happens in the worker too. Returns the output rows
+    and any error messages.
+    """
+    input_format, items = task
+    outputs, errors = [], []
+    for line_number, row in items:
+        record = {}
+        try:
+            record = json.loads(row) if input_format == "jsonl" else row
+            if not isinstance(record, dict):
+                record = {}
+                raise ValueError("each line must be a JSON object.")
+            record["score"] = score_record(record)
+        except ValueError as e:
+            record["score"] = None
+            errors.append(f"line {line_number}: {e}")
+        outputs.append(json.dumps(record) if input_format == "jsonl" else record)
+    return outputs, errors
+
+
+def read_chunks(input_file, input_format, chunk_size):
+    """Yields (format, [(line_number, row), ...]) chunks without reading ahead."""
+    if input_format == "csv":
+        rows = ((reader.line_num, row) for reader in [csv.DictReader(input_file)] for row in reader)
+    else:
+        rows = ((i, line) for i, line in enumerate(input_file, start=1) if line.strip())
+    chunk = []
+    for item in rows:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield input_format, chunk
+            chunk = []
+    if chunk:
+        yield input_format, chunk
+
+
+def score_chunks(chunks, workers):
+    """
+    Scores chunks in order. With more than one worker, chunks are handed to a
+    process pool with at most two chunks in flight per worker, so a huge input
+    is never queued up in memory all at once.
+    """
+    if workers <= 1:
+        for chunk in chunks:
+            yield score_chunk(chunk)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        in_flight = deque()
+        for chunk in chunks:
+            in_flight.append(pool.apply_async(score_chunk, (chunk,)))
+            if len(in_flight) >= workers * 2:
+                yield in_flight.popleft().get()
+        while in_flight:
+            yield in_flight.popleft().get()
+
+
+def run_batch(input_path, output_path, input_format, workers, chunk_size):
+    """Streams rows from a file (or stdin for '-') and writes scored rows out."""
+    if input_format is None:
+        input_format = "csv" if input_path.lower().endswith(".csv") else "jsonl"
+    if workers is None:
+        is_large = input_path != "-" and os.path.getsize(input_path) >= AUTO_POOL_MIN_BYTES
+        workers = (os.cpu_count() or 1) if is_large else 1
+
+    input_file = sys.stdin if input_path == "-" else open(input_path, newline="", encoding="utf-8")
+    output_file = sys.stdout if output_path == "-" else open(output_path, "w", newline="", encoding="utf-8")
+    error_count = 0
+    try:
+        writer = None
+        for outputs, errors in score_chunks(read_chunks(input_file, input_format, chunk_size), workers):
+            for message in errors:
+                print(f"Error: {message}", file=sys.stderr)
+            error_count += len(errors)
+            if input_format == "jsonl":
+                output_file.write("\n".join(outputs) + "\n")
+                continue
+            for row in outputs:
+                if writer is None:
+                    writer = csv.DictWriter(output_file, fieldnames=list(row.keys()), extrasaction="ignore")
+                    writer.writeheader()
+                writer.writerow(row)
+        output_file.flush()
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+    return error_count
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="LENS movie rater. Run without arguments for the interactive questionnaire.")
+    parser.add_argument("--batch", metavar="FILE", nargs="?", const="-", help="Score rating rows non-interactively from FILE (default: stdin).")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="Input format (default: from the file extension, else jsonl).")
+    parser.add_argument("--output", default="-", metavar="FILE", help="Where to write scored rows (default: stdout).")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: all cores for large files, otherwise 1).")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Rows per chunk (default: 1000).")
+    return parser.parse_args(argv)
+
+
 # --- MAIN EXECUTION BLOCK ---
 # This is where the program runs.
 if __name__ == "__main__":
+    args = parse_args()
+    if args.batch is not None:
+        # Non-interactive mode: score a whole file and exit
+        errors = run_batch(args.batch, args.output, args.format, args.workers, args.chunk_size)
+        sys.exit(1 if errors else 0)
+
     # 1. Create a rater object with all your defined categories
     movie_rater = MovieRater(CATEGORY_DEFINITIONS)
     
@@ -1,8 +1,33 @@
 import streamlit as st
 import requests
+import numpy as np
 import pandas as pd
 import gspread
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from PIL import Image, ImageDraw
+import atexit
+import gzip
+import hashlib
+import heapq
+import io
+import json
+import math
+import mmap
+import os
+import queue
+import random
+import sqlite3
+import struct
+import threading
+import time
+import unicodedata
+import uuid
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from datetime import datetime
+from types import MappingProxyType
 
 # ==============================================================================
 # 0. DATA DEFINITIONS (PASTE YOUR FULL LIST HERE)
@@ -275,67 +300,1649 @@ CATEGORY_DEFINITIONS = [
 # 1. API, DATABASE, & CORE FUNCTIONS
 # ==============================================================================
 
+# --- OMDb Response Cache ---
+# Fresh for TTL seconds, then served stale (and refreshed in the background)
+# for up to STALE more; "Response: False" answers are cached for NEGATIVE.
+OMDB_SEARCH_TTL = 24 * 3600
+OMDB_DETAILS_TTL = 7 * 24 * 3600
+OMDB_STALE_TTL = 30 * 24 * 3600
+OMDB_NEGATIVE_TTL = 3600
+
+class TwoTierCache:
+    # In-memory LRU in front of a SQLite file. Values are JSON-serialisable;
+    # None is a cached negative answer.
+    def __init__(self, path, max_entries=2048, stale_ttl=OMDB_STALE_TTL, negative_ttl=OMDB_NEGATIVE_TTL):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_entries, self.stale_ttl, self.negative_ttl = max_entries, stale_ttl, negative_ttl
+        self.stats = {"hits": 0, "disk_hits": 0, "stale_hits": 0, "negative_hits": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0}
+        self._memory = OrderedDict()  # key -> (value, stored_at, ttl)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, stored_at REAL, ttl REAL)")
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry, "hits"
+            found = self._conn.execute("SELECT value, stored_at, ttl FROM cache WHERE key = ?", (key,)).fetchone()
+        if found is None: return None, "misses"
+        entry = (json.loads(found[0]), found[1], found[2])
+        self._remember(key, entry)
+        return entry, "disk_hits"
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries: self._memory.popitem(last=False)
+
+    def put(self, key, value, ttl):
+        entry = (value, time.time(), self.negative_ttl if value is None else ttl)
+        self._remember(key, entry)
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO cache (key, value, stored_at, ttl) VALUES (?, ?, ?, ?)", (key, json.dumps(entry[0]), entry[1], entry[2]))
+        return value
+
+    def get_or_fetch(self, key, fetch, ttl):
+        entry, tier = self._lookup(key)
+        if entry is not None:
+            value, stored_at, entry_ttl = entry
+            age = time.time() - stored_at
+            if age < entry_ttl:
+                self.stats[tier] += 1
+                if value is None: self.stats["negative_hits"] += 1
+                return value
+            if value is not None and age < entry_ttl + self.stale_ttl:
+                self.stats["stale_hits"] += 1
+                self._refresh_in_background(key, fetch, ttl)
+                return value
+        self.stats["misses"] += 1
+        return self.put(key, fetch(), ttl)
+
+    def iter_values(self, prefix):
+        # Every stored (non-negative) value whose key starts with prefix, fresh or not.
+        with self._lock:
+            rows = self._conn.execute("SELECT value FROM cache WHERE key >= ? AND key < ? AND value != 'null'", (prefix, prefix + "\uffff")).fetchall()
+        return [json.loads(value) for (value,) in rows]
+
+    def _refresh_in_background(self, key, fetch, ttl):
+        with self._lock:
+            if key in self._refreshing: return
+            self._refreshing.add(key)
+        def refresh():
+            try:
+                self.put(key, fetch(), ttl)
+                self.stats["refreshes"] += 1
+            except Exception:
+                self.stats["refresh_errors"] += 1
+            finally:
+                with self._lock: self._refreshing.discard(key)
+        threading.Thread(target=refresh, name=f"cache-refresh-{key}", daemon=True).start()
+
+@st.cache_resource
+def get_omdb_cache():
+    return TwoTierCache(os.path.join(LOCAL_DATA_DIR, "omdb_cache.db"))
+
+def normalize_query(query):
+    return " ".join(query.split()).casefold()
+
+# --- OMDb HTTP Client ---
+OMDB_URL = "https://www.omdbapi.com/"
+OMDB_CONNECT_TIMEOUT = 3.05
+OMDB_READ_TIMEOUT = 5
+
+@st.cache_resource
+def get_omdb_session(pool_size=10, retries=3, backoff_factor=0.5):
+    # One keep-alive session per process: pooled TLS connections, and urllib3
+    # retries with exponential backoff (honouring Retry-After) for 429/5xx.
+    retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=frozenset(["GET"]), respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def omdb_get(api_key, timeout=None, **params):
+    # params are URL-encoded by requests, so titles with '&', '#' or spaces are safe
+    response = get_omdb_session().get(OMDB_URL, params={**params, "apikey": api_key}, timeout=timeout or (OMDB_CONNECT_TIMEOUT, OMDB_READ_TIMEOUT))
+    response.raise_for_status()
+    return response.json()
+
+# --- OMDb Request Gate ---
+# Shared by every session in the process: identical lookups already in flight
+# are joined rather than repeated, and the rest draw from a token bucket
+# (OMDB_RATE_LIMIT requests/second, bursts of OMDB_BURST). A request that would
+# wait more than OMDB_MAX_WAIT seconds for a token fails fast instead.
+# Background lookups (prefetches) never wait: they only take a token while more
+# than OMDB_PREFETCH_RESERVE remain, so interactive lookups keep the headroom.
+class OmdbThrottled(requests.exceptions.RequestException):
+    pass  # a RequestException, so callers treat it like any other failed (uncached) request
+
+class TokenBucket:
+    # acquire() reserves the next token and sleeps until it is due, so waiting
+    # callers are served in arrival order; returns the wait, or None if it
+    # would exceed max_wait (nothing is reserved then).
+    def __init__(self, rate, capacity, max_wait):
+        self.rate, self.capacity, self.max_wait = rate, capacity, max_wait
+        self._tokens, self._updated = float(capacity), time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+            if wait > self.max_wait: return None
+            self._tokens -= 1
+        if wait: time.sleep(wait)
+        return wait
+
+    def try_acquire(self, reserve=0):
+        # Takes a token only if one is free now with `reserve` more left over; never sleeps.
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1 + reserve: return False
+            self._tokens -= 1
+            return True
+
+class SingleFlight:
+    # do(key, fn) runs fn once per key at a time; concurrent callers with the
+    # same key block on the leader's Future and share its result or exception.
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader: future = self._calls[key] = Future()
+        if leader:
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock: del self._calls[key]
+        return future.result(), not leader
+
+class OmdbGate:
+    def __init__(self, rate=5.0, burst=10, max_wait=2.0, background_reserve=5):
+        self.bucket, self.flights = TokenBucket(rate, burst, max_wait), SingleFlight()
+        self.background_reserve = background_reserve
+        self.stats = {"requests": 0, "coalesced": 0, "queued": 0, "throttled": 0, "skipped": 0}
+
+    def call(self, key, fetch, background=False):
+        def limited():
+            if background:
+                if not self.bucket.try_acquire(self.background_reserve):
+                    self.stats["skipped"] += 1
+                    raise OmdbThrottled(f"OMDb busy; background lookup of {key} skipped.")
+                self.stats["requests"] += 1
+                return fetch()
+            waited = self.bucket.acquire()
+            if waited is None:
+                self.stats["throttled"] += 1
+                raise OmdbThrottled(f"OMDb rate limit reached; {key} not requested.")
+            if waited: self.stats["queued"] += 1
+            self.stats["requests"] += 1
+            return fetch()
+        value, coalesced = self.flights.do(key, limited)
+        if coalesced: self.stats["coalesced"] += 1
+        return value
+
+@st.cache_resource(show_spinner=False)  # first use may be on a prefetch/refresh thread
+def get_omdb_gate():
+    burst = int(st.secrets.get("OMDB_BURST", 10))
+    return OmdbGate(rate=float(st.secrets.get("OMDB_RATE_LIMIT", 5.0)), burst=burst, max_wait=float(st.secrets.get("OMDB_MAX_WAIT", 2.0)),
+                    background_reserve=int(st.secrets.get("OMDB_PREFETCH_RESERVE", burst // 2)))
+
 # --- OMDb API Functions ---
-# Note: No caching decorator here is correct, as we want fresh results.
+# Results go through the two-tier cache above and cache misses through the
+# request gate; the fetchers return None for an OMDb "Response: False" so it is
+# negatively cached, and raise on network errors (or throttling) so those are
+# never cached. Interactive lookups let OmdbThrottled through so the UI can say
+# "busy" instead of showing nothing.
 def search_omdb(api_key, query):
     if not api_key or not query: return []
-    url = f"http://www.omdbapi.com/?s={query.strip()}&type=movie&apikey={api_key}"
+    def fetch():
+        data = omdb_get(api_key, s=query.strip(), type="movie")
+        return data.get("Search", []) if data.get("Response") == "True" else None
     try:
-            response = requests.get(url, timeout=5)
-            response.raise_for_status()
-            data = response.json()
-            if data.get("Response") == "True": return data.get("Search", [])
+        key = f"search:{normalize_query(query)}"
+        return get_omdb_cache().get_or_fetch(key, lambda: get_omdb_gate().call(key, fetch), OMDB_SEARCH_TTL) or []
+    except OmdbThrottled: raise
     except requests.exceptions.RequestException: return []
-    return []
 
-def get_movie_details(api_key, imdb_id):
+def get_movie_details(api_key, imdb_id, background=False):
+    # background=True (prefetches) never waits for, or raises on, the rate limit.
     if not api_key or not imdb_id: return None
-    url = f"http://www.omdbapi.com/?i={imdb_id}&apikey={api_key}"
+    def fetch():
+        data = omdb_get(api_key, i=imdb_id.strip())
+        return data if data.get("Response") == "True" else None
     try:
-            response = requests.get(url, timeout=5)
-            response.raise_for_status()
-            data = response.json()
-            if data.get("Response") == "True": return data
+        key = f"details:{imdb_id.strip()}"
+        return get_omdb_cache().get_or_fetch(key, lambda: get_omdb_gate().call(key, fetch, background), OMDB_DETAILS_TTL)
+    except OmdbThrottled:
+        if background: return None
+        raise
     except requests.exceptions.RequestException: return None
-    return None
+
+class DetailsPrefetcher:
+    # Fetches details for every search result on a bounded thread pool as soon as
+    # the search returns, so "Select to Rate" is normally a cache hit. In-flight
+    # futures are kept so a click that races the prefetch waits on it instead of
+    # issuing a second request; once finished, details are always read back
+    # through fetch (i.e. the OMDb cache), so its TTLs and refreshes apply.
+    def __init__(self, fetch, max_workers=4, max_tracked=512):
+        self.fetch, self.max_tracked = fetch, max_tracked
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="omdb-prefetch")
+        self._futures = {}           # imdbID -> in-flight Future
+        self._landed = OrderedDict()  # imdbIDs whose prefetch succeeded (LRU-bounded)
+        self._lock = threading.RLock()  # done-callbacks may run inside prefetch()
+
+    def prefetch(self, api_key, imdb_ids):
+        with self._lock:
+            for imdb_id in imdb_ids:
+                if imdb_id in self._futures: continue
+                future = self._futures[imdb_id] = self._pool.submit(self.fetch, api_key, imdb_id, background=True)
+                future.add_done_callback(lambda future, imdb_id=imdb_id: self._finished(imdb_id, future))
+
+    def _finished(self, imdb_id, future):
+        with self._lock:
+            self._futures.pop(imdb_id, None)
+            if future.cancelled() or future.exception() is not None or future.result() is None: return
+            self._landed[imdb_id] = True
+            self._landed.move_to_end(imdb_id)
+            while len(self._landed) > self.max_tracked: self._landed.popitem(last=False)
+
+    def peek(self, api_key, imdb_id):
+        # Non-blocking: details once the prefetch has landed in the cache, else None.
+        return self.fetch(api_key, imdb_id, background=True) if imdb_id in self._landed else None
+
+    def get(self, api_key, imdb_id, timeout=10):
+        future = self._futures.get(imdb_id)
+        if future is not None:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+        return self.fetch(api_key, imdb_id)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+@st.cache_resource
+def get_details_prefetcher():
+    prefetcher = DetailsPrefetcher(get_movie_details)
+    atexit.register(prefetcher.shutdown)
+    return prefetcher
+
+# --- Poster Cache ---
+# Posters are downloaded once, stored under the SHA-256 of their bytes (so the
+# same image behind two URLs is kept once) and resized per size on first use;
+# st.image is handed the cached JPEG bytes, never a remote URL. Missing or
+# unreachable posters get a locally drawn placeholder.
+POSTER_SIZES = {"thumb": (100, 148), "header": (300, 444)}
+POSTER_FAILURE_TTL = 600  # a failed download is not retried for this long
+POSTER_WARM_WAIT = 0.3     # how long a page of results waits, in total, for warm() downloads
+
+class PosterCache:
+    def __init__(self, directory, session, max_workers=4, timeout=(OMDB_CONNECT_TIMEOUT, 10)):
+        self.directory, self.session, self.timeout = directory, session, timeout
+        os.makedirs(os.path.join(directory, "urls"), exist_ok=True)
+        self.flights = SingleFlight()
+        self.stats = {"hits": 0, "downloads": 0, "failures": 0}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="poster-cache")
+        self._failures = {}    # url -> time.monotonic() of the last failed download
+        self._warming = {}  # url -> Future of a download warm() is still running
+        self._warming_lock = threading.Lock()
+
+    def _path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    @staticmethod
+    def _write(path, data):
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f: f.write(data)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _jpeg(image):
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=85, optimize=True)
+        return buffer.getvalue()
+
+    def _pointer(self, url):
+        return self._path("urls", hashlib.sha1(url.encode()).hexdigest())
+
+    def _content_hash(self, url):
+        # URL -> content hash via a pointer file; downloads only for unseen URLs.
+        pointer = self._pointer(url)
+        if os.path.exists(pointer):
+            self.stats["hits"] += 1
+            with open(pointer, "rb") as f: return f.read().decode()
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        digest = hashlib.sha256(response.content).hexdigest()
+        if not os.path.exists(self._path(f"{digest}.orig")): self._write(self._path(f"{digest}.orig"), response.content)
+        self._write(pointer, digest.encode())
+        self.stats["downloads"] += 1
+        return digest
+
+    def _resized(self, digest, size):
+        path = self._path(f"{digest}_{size}.jpg")
+        if not os.path.exists(path):
+            with Image.open(self._path(f"{digest}.orig")) as image:
+                image = image.convert("RGB")
+                image.thumbnail(POSTER_SIZES[size], Image.LANCZOS)
+                self._write(path, self._jpeg(image))
+        with open(path, "rb") as f: return f.read()
+
+    def placeholder(self, size="thumb"):
+        path = self._path(f"placeholder_{size}.jpg")
+        if not os.path.exists(path):
+            width, height = POSTER_SIZES[size]
+            image = Image.new("RGB", (width, height), (38, 39, 48))
+            ImageDraw.Draw(image).text((width // 2, height // 2), "No Poster", fill=(160, 160, 170), anchor="mm")
+            self._write(path, self._jpeg(image))
+        with open(path, "rb") as f: return f.read()
+
+    def _load(self, url, size):
+        # Poster bytes, or None if the download failed (now or within POSTER_FAILURE_TTL).
+        failed_at = self._failures.get(url)
+        if failed_at is not None and time.monotonic() - failed_at < POSTER_FAILURE_TTL: return None
+        try:
+            digest, _ = self.flights.do(url, lambda: self._content_hash(url))
+            return self._resized(digest, size)
+        except Exception:
+            self.stats["failures"] += 1
+            now = time.monotonic()
+            if len(self._failures) >= 1024:
+                self._failures = {u: t for u, t in self._failures.items() if now - t < POSTER_FAILURE_TTL}
+            self._failures[url] = now
+            return None
+
+    def get(self, url, size="thumb"):
+        # JPEG bytes of the poster at one of POSTER_SIZES; concurrent first
+        # requests for a URL share one download. Never waits on warm(): a URL it
+        # is still fetching gets the placeholder (see wait_for_warm).
+        if url and url.startswith(("http://", "https://")) and (url not in self._warming or os.path.exists(self._pointer(url))):
+            poster = self._load(url, size)
+            if poster is not None: return poster
+        return self.placeholder(size)
+
+    def _warm(self, url, size):
+        try:
+            self._load(url, size)
+        finally:
+            with self._warming_lock: self._warming.pop(url, None)
+
+    def warm(self, urls, size="thumb"):
+        # Background download + resize, e.g. for a page of search results.
+        with self._warming_lock:
+            for url in urls:
+                if url and url.startswith(("http://", "https://")) and url not in self._warming:
+                    self._warming[url] = self._pool.submit(self._warm, url, size)
+
+    def wait_for_warm(self, urls, timeout=POSTER_WARM_WAIT):
+        # Gives the warm() downloads for a page one shared, bounded wait before
+        # it is drawn, so quick downloads show the poster on the first render.
+        with self._warming_lock: futures = [self._warming[url] for url in urls if url in self._warming]
+        if futures: wait(futures, timeout=timeout)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+@st.cache_resource
+def get_poster_cache():
+    posters = PosterCache(os.path.join(LOCAL_DATA_DIR, "posters"), get_omdb_session())
+    atexit.register(posters.shutdown)
+    return posters
+
+# --- Offline Title Catalog ---
+# Optional: point TITLE_CATALOG_TSV at an IMDb title.basics.tsv(.gz) dump and it is
+# compiled once into LOCAL_DATA_DIR/title_catalog.idx, a memory-mapped file of
+# title-sorted records plus a trigram index, so searches are answered locally
+# and OMDb is only the fallback (and the source of posters/plots).
+#
+# Layout (little-endian): header | record offsets uint32[n+1] | trigram counts
+# uint16[n] (padded to 4 bytes) | trigram directory uint32[TRIGRAM_SPACE+1] |
+# postings uint32[p] | blob of "normalized\x1ftconst\x1ftitle\x1fyear" records.
+CATALOG_MAGIC = b"LENSCAT1"
+CATALOG_HEADER = struct.Struct("<8sIII")  # magic, record count, posting count, blob size
+TRIGRAM_ALPHABET = " abcdefghijklmnopqrstuvwxyz0123456789"
+TRIGRAM_SPACE = len(TRIGRAM_ALPHABET) ** 3
+
+def normalize_title(title):
+    # Accent-folded, lowercase, alphanumerics only, single spaces.
+    folded = unicodedata.normalize("NFKD", title).encode("ascii", "ignore").decode("ascii").lower()
+    return " ".join("".join(ch if ch.isalnum() else " " for ch in folded).split())
+
+def title_trigrams(normalized):
+    padded = f" {normalized} "
+    codes = {TRIGRAM_ALPHABET.index(a) * 1369 + TRIGRAM_ALPHABET.index(b) * 37 + TRIGRAM_ALPHABET.index(c) for a, b, c in zip(padded, padded[1:], padded[2:])}
+    return sorted(codes)
+
+def build_title_catalog(tsv_path, index_path, title_types=("movie",)):
+    # Streams the dump, keeps non-adult titles of the given types, writes the index atomically.
+    records = []
+    opener = gzip.open if tsv_path.endswith(".gz") else open
+    with opener(tsv_path, "rt", encoding="utf-8", newline="") as f:
+        next(f, None)  # header: tconst titleType primaryTitle originalTitle isAdult startYear ...
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 6 or fields[1] not in title_types or fields[4] == "1": continue
+            normalized = normalize_title(fields[2])
+            if normalized: records.append((normalized, fields[0], fields[2], fields[5] if fields[5] != "\\N" else "N/A"))
+    records.sort()
+
+    blob, offsets, trigram_counts, postings_codes, postings_ids = bytearray(), array("I", [0]), array("H"), array("I"), array("I")
+    for record_id, record in enumerate(records):
+        blob += "\x1f".join(record).encode("utf-8")
+        offsets.append(len(blob))
+        trigrams = title_trigrams(record[0])
+        trigram_counts.append(min(len(trigrams), 65535))
+        postings_codes.extend(trigrams)
+        postings_ids.extend([record_id] * len(trigrams))
+    codes = np.frombuffer(postings_codes, dtype=np.uint32)
+    order = np.argsort(codes, kind="stable")
+    directory = np.searchsorted(codes[order], np.arange(TRIGRAM_SPACE + 1), side="left").astype(np.uint32)
+    postings = np.frombuffer(postings_ids, dtype=np.uint32)[order]
+
+    tmp_path = index_path + ".tmp"
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    with open(tmp_path, "wb") as out:
+        out.write(CATALOG_HEADER.pack(CATALOG_MAGIC, len(records), len(postings), len(blob)))
+        out.write(offsets.tobytes())
+        out.write(trigram_counts.tobytes() + b"\0" * (len(records) % 2 * 2))
+        out.write(directory.tobytes())
+        out.write(postings.tobytes())
+        out.write(bytes(blob))
+    os.replace(tmp_path, index_path)
+
+class TitleCatalog:
+    # Read-only view over a compiled catalog file; nothing is loaded into memory
+    # up front, NumPy arrays are windows onto the mmap.
+    def __init__(self, index_path):
+        self._file = open(index_path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.size, posting_count, blob_size = CATALOG_HEADER.unpack_from(self._mmap, 0)
+        if magic != CATALOG_MAGIC: raise ValueError(f"{index_path} is not a LENS title catalog.")
+        pos = CATALOG_HEADER.size
+        self.offsets = np.frombuffer(self._mmap, dtype=np.uint32, count=self.size + 1, offset=pos); pos += 4 * (self.size + 1)
+        self.trigram_counts = np.frombuffer(self._mmap, dtype=np.uint16, count=self.size, offset=pos); pos += 2 * self.size + self.size % 2 * 2
+        self.directory = np.frombuffer(self._mmap, dtype=np.uint32, count=TRIGRAM_SPACE + 1, offset=pos); pos += 4 * (TRIGRAM_SPACE + 1)
+        self.postings = np.frombuffer(self._mmap, dtype=np.uint32, count=posting_count, offset=pos); pos += 4 * posting_count
+        self._blob_start = pos
+
+    def _record(self, record_id):
+        start, end = self._blob_start + int(self.offsets[record_id]), self._blob_start + int(self.offsets[record_id + 1])
+        return self._mmap[start:end].decode("utf-8").split("\x1f")
+
+    def _lower_bound(self, normalized):
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._record(mid)[0] < normalized: lo = mid + 1
+            else: hi = mid
+        return lo
+
+    def prefix_matches(self, normalized, limit):
+        matches, record_id = [], self._lower_bound(normalized)
+        while record_id < self.size and len(matches) < limit * 5:
+            if not self._record(record_id)[0].startswith(normalized): break
+            matches.append(record_id)
+            record_id += 1
+        # Shortest (closest) titles first among the prefix hits
+        return sorted(matches, key=lambda rid: int(self.offsets[rid + 1] - self.offsets[rid]))[:limit]
+
+    def fuzzy_matches(self, normalized, limit, min_coverage=0.5):
+        # Candidates must share at least min_coverage of the query's trigrams; ranked by Jaccard similarity.
+        query_trigrams = title_trigrams(normalized)
+        if not query_trigrams: return []
+        hits = np.concatenate([self.postings[self.directory[code]:self.directory[code + 1]] for code in query_trigrams])
+        if not len(hits): return []
+        record_ids, shared = np.unique(hits, return_counts=True)
+        keep = shared >= min_coverage * len(query_trigrams)
+        record_ids, shared = record_ids[keep], shared[keep]
+        similarity = shared / (len(query_trigrams) + self.trigram_counts[record_ids].astype(np.int64) - shared)
+        best = np.argsort(-similarity, kind="stable")[:limit]
+        return [int(record_ids[i]) for i in best]
+
+    def search(self, query, limit=10):
+        # Exact/prefix hits first, then trigram (typo-tolerant) hits; OMDb result shape.
+        normalized = normalize_title(query)
+        if not normalized: return []
+        ranked = list(dict.fromkeys(self.prefix_matches(normalized, limit) + self.fuzzy_matches(normalized, limit)))[:limit]
+        results = []
+        for record_id in ranked:
+            _, imdb_id, title, year = self._record(record_id)
+            results.append({"Title": title, "Year": year, "imdbID": imdb_id, "Type": "movie", "Poster": "N/A"})
+        return results
+
+class TitleCatalogHandle:
+    # Opens the compiled catalog, compiling it first on a background thread when
+    # it is missing or older than the dump; get() is None until it is ready.
+    def __init__(self, tsv_path, index_path):
+        self.tsv_path, self.index_path = tsv_path, index_path
+        self.catalog, self.last_error = None, None
+        if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(tsv_path): self._open()
+        else: threading.Thread(target=self._build, name="title-catalog-build", daemon=True).start()
+
+    def _open(self):
+        try:
+            self.catalog = TitleCatalog(self.index_path)
+        except Exception as e:
+            self.last_error = e
+
+    def _build(self):
+        try:
+            build_title_catalog(self.tsv_path, self.index_path)
+            self._open()
+        except Exception as e:
+            self.last_error = e
+
+    def get(self):
+        return self.catalog
+
+@st.cache_resource
+def get_title_catalog():
+    tsv_path = st.secrets.get("TITLE_CATALOG_TSV", "")
+    if not tsv_path or not os.path.exists(tsv_path): return None
+    return TitleCatalogHandle(tsv_path, os.path.join(LOCAL_DATA_DIR, "title_catalog.idx"))
+
+def search_titles(api_key, query):
+    # Local catalog first (milliseconds, no quota); OMDb when it has nothing.
+    handle = get_title_catalog()
+    catalog = handle.get() if handle is not None else None
+    if catalog is not None:
+        results = catalog.search(query)
+        if results: return remember_titles(results)
+    return remember_titles(search_omdb(api_key, query))
+
+# --- Title Autocomplete ---
+class TitleSuggestIndex:
+    # Every title a search has returned and every rated title, ranked so rated
+    # and often-seen titles come first. The search box hands the top of this
+    # list to a selectbox, which filters it in the browser as the user types.
+    def __init__(self):
+        self._titles = {}  # imdbID -> [title, year, times seen, times rated]
+        self._lock = threading.Lock()
+
+    def __contains__(self, imdb_id):
+        return imdb_id in self._titles
+
+    def _entry(self, imdb_id, title, year):
+        entry = self._titles.get(imdb_id)
+        if entry is None:
+            entry = self._titles[imdb_id] = [title, year, 0, 0]
+        elif year and entry[1] in ("", "N/A"):
+            entry[1] = year
+        return entry
+
+    def add(self, imdb_id, title, year="", seen=1, rated=0):
+        if not imdb_id or not title: return
+        with self._lock:
+            entry = self._entry(imdb_id, title, year)
+            entry[2] += seen
+            entry[3] += rated
+
+    def extend(self, items):
+        # Bulk load of (imdbID, title, year, seen, rated).
+        with self._lock:
+            for imdb_id, title, year, seen, rated in items:
+                if not imdb_id or not title: continue
+                entry = self._entry(imdb_id, title, year)
+                entry[2] += seen
+                entry[3] += rated
+
+    def top(self, limit=2000):
+        # {imdbID: "Title (Year)"} for the best-ranked titles, best first.
+        with self._lock:
+            best = heapq.nsmallest(limit, self._titles.items(), key=lambda item: (-(3 * item[1][3] + item[1][2]), item[1][0]))
+        return {imdb_id: f"{title} ({year})" if year and year != "N/A" else title for imdb_id, (title, year, _, _) in best}
+
+@st.cache_resource
+def get_title_suggestions():
+    # Seeded from everything the OMDb cache has on disk; rated titles are added
+    # when the ratings store opens (see get_rating_store).
+    index = TitleSuggestIndex()
+    cache = get_omdb_cache()
+    seen = [(movie.get("imdbID"), movie.get("Title"), movie.get("Year", ""), 1, 0) for results in cache.iter_values("search:") for movie in results]
+    seen += [(movie.get("imdbID"), movie.get("Title"), movie.get("Year", ""), 0, 0) for movie in cache.iter_values("details:")]
+    index.extend(seen)
+    return index
+
+def remember_titles(results):
+    get_title_suggestions().extend((movie.get("imdbID"), movie.get("Title"), movie.get("Year", ""), 1, 0) for movie in results)
+    return results
 
 # --- Google Sheets Functions ---
+LEGACY_WORKSHEET = "Sheet1"
+MANIFEST_WORKSHEET = "partitions"
+
+class RatingSheets:
+    # Router over the ratings worksheets of MovieRatingsDB. SHEET_PARTITIONING
+    # decides where new rows go:
+    #   "none" (default)  everything in Sheet1, as before
+    #   "hash:N"          N tabs ratings_h00.. keyed by a hash of the imdbID
+    #   "month"           one tab per month of the rating, ratings_YYYY_MM
+    # Partition tabs are created on first write and recorded in the
+    # "partitions" manifest tab, which is how readers find them. Sheet1 is
+    # always read, so ratings from before partitioning (or a scheme change)
+    # stay visible.
+    # All tabs live in the one spreadsheet and share its cell limit: partitions
+    # keep each tab (and each read) small, they do not raise that ceiling. New
+    # tabs start with a single row so they only take the cells they use.
+    def __init__(self, spreadsheet, scheme="none"):
+        self.spreadsheet, self.scheme = spreadsheet, scheme
+        self.kind, _, buckets = scheme.partition(":")
+        if self.kind not in ("none", "hash", "month"): raise ValueError(f"Unknown SHEET_PARTITIONING scheme: {scheme!r}")
+        self.buckets = int(buckets or 16)
+        self._worksheets = {}
+        self._lock = threading.RLock()
+        self.refresh()
+
+    def title_for(self, row):
+        if self.kind == "hash":
+            return f"ratings_h{int(hashlib.sha1(str(row[0]).strip().encode()).hexdigest(), 16) % self.buckets:02d}"
+        if self.kind == "month":
+            return f"ratings_{str(row[4])[:7].replace('-', '_')}"
+        return LEGACY_WORKSHEET
+
+    def refresh(self):
+        # Re-reads the manifest, picking up partitions other processes created.
+        try:
+            manifest = self.spreadsheet.worksheet(MANIFEST_WORKSHEET)
+            titles = [row[0] for row in manifest.get_all_values()[1:] if row and row[0]]
+        except gspread.exceptions.WorksheetNotFound:
+            manifest, titles = None, []
+        with self._lock:
+            self._manifest = manifest
+            self.titles = list(dict.fromkeys([LEGACY_WORKSHEET] + titles))
+
+    def add_partitions(self, titles):
+        # Partitions another process recorded in the manifest (see WorksheetReplica.sync).
+        with self._lock:
+            new = [title for title in titles if title and title not in self.titles]
+            self.titles.extend(dict.fromkeys(new))
+            return new
+
+    def row_counts(self):
+        # title -> grid rows of every tab, from one metadata request.
+        metadata = self.spreadsheet.fetch_sheet_metadata(params={"fields": "sheets.properties(title,gridProperties.rowCount)"})
+        return {sheet["properties"]["title"]: sheet["properties"]["gridProperties"]["rowCount"] for sheet in metadata.get("sheets", [])}
+
+    def read_ranges(self, ranges):
+        # {key: A1 range} -> {key: rows}, all in one values.batchGet request.
+        if not ranges: return {}
+        response = self.spreadsheet.values_batch_get(list(ranges.values()))
+        return {key: value_range.get("values", []) for key, value_range in zip(ranges, response.get("valueRanges", []))}
+
+    def _open(self, title):
+        if title not in self._worksheets: self._worksheets[title] = self.spreadsheet.worksheet(title)
+        return self._worksheets[title]
+
+    def _create(self, title, header, rows=1):
+        try:
+            worksheet = self.spreadsheet.add_worksheet(title, rows=rows, cols=len(header))
+            worksheet.append_row(header)
+            return worksheet
+        except gspread.exceptions.APIError:
+            return self.spreadsheet.worksheet(title)  # another process created it first
+
+    def worksheet_for(self, row):
+        title = self.title_for(row)
+        with self._lock:
+            if title in self.titles: return self._open(title)
+            self._worksheets[title] = self._create(title, RATING_COLUMNS)
+            if self._manifest is None: self._manifest = self._create(MANIFEST_WORKSHEET, ["worksheet", "scheme", "created"])
+            self._manifest.append_row([title, self.scheme, datetime.now().strftime("%Y-%m-%d %H:%M:%S")])
+            self.titles.append(title)
+            return self._worksheets[title]
+
+    def worksheets(self):
+        # [(title, worksheet)] for every partition, Sheet1 first.
+        with self._lock:
+            return [(title, self._open(title)) for title in self.titles]
+
 @st.cache_resource
 def connect_to_gsheet():
     creds = st.secrets["gcp_service_account"]
     gc = gspread.service_account_from_dict(creds)
     spreadsheet = gc.open("MovieRatingsDB")
-    return spreadsheet.worksheet("Sheet1")
+    return RatingSheets(spreadsheet, st.secrets.get("SHEET_PARTITIONING", "none"))
+
+# Sheet columns: imdbID, movieTitle, userName, rating, timestamp, ratingID
+RATING_ID_COLUMN = 6
+
+class RatingJournal:
+    # Append-only, fsync'd JSONL log of every submission, written before anything
+    # talks to Google. Each line is either {"row": [...]} for a rating or
+    # {"ack": [ratingIDs]} once those rows are confirmed in the worksheet.
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+
+    def append(self, row):
+        self._write_line({"row": row}, durable=True)
+
+    def ack(self, rating_ids):
+        # Acks are not fsync'd: a lost ack only means a replay, which is deduped.
+        if rating_ids: self._write_line({"ack": list(rating_ids)}, durable=False)
+
+    def unacked(self):
+        rows, acked = {}, set()
+        if not os.path.exists(self.path): return []
+        with self._lock, open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn final line from a crash mid-write
+                if "row" in record: rows[record["row"][RATING_ID_COLUMN - 1]] = record["row"]
+                else: acked.update(record.get("ack", []))
+        return [row for rating_id, row in rows.items() if rating_id not in acked]
+
+    def compact(self):
+        # Rewrite the journal with only the unacknowledged ratings (atomic replace).
+        pending = self.unacked()
+        tmp_path = self.path + ".tmp"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for row in pending: f.write(json.dumps({"row": row}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        return pending
+
+    def _write_line(self, record, durable):
+        line = json.dumps(record) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            if durable: os.fsync(f.fileno())
+
+
+class RatingWriteQueue:
+    # Process-wide write-behind buffer in front of the worksheet. Submissions only
+    # pay for a journal append and a queue.put(); a background thread connects,
+    # batches rows into append_rows calls (by size or by time) and acknowledges
+    # them in the journal, so Sheets outages never reach the user.
+    def __init__(self, connect, journal, replay=(), batch_size=50, flush_interval=2.0, max_retries=5, backoff_base=1.0, backoff_max=30.0):
+        self.connect, self.journal = connect, journal
+        self.batch_size, self.flush_interval = batch_size, flush_interval
+        self.max_retries, self.backoff_base, self.backoff_max = max_retries, backoff_base, backoff_max
+        self.rows_written, self.rows_deduped, self.failed_attempts, self.last_error = 0, 0, 0, None
+        self.sheets = None
+        self._queue = queue.Queue()
+        self._pending = list(replay)  # replayed rows, then batches that exhausted their retries
+        self._unverified_ids = {row[RATING_ID_COLUMN - 1] for row in self._pending}
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rating-write-queue", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, row):
+        if self._closed.is_set(): raise RuntimeError("The rating write queue has been shut down.")
+        self.journal.append(row)
+        self._queue.put(row)
+
+    def backlog(self):
+        return len(self._pending) + self._queue.qsize()
+
+    def close(self, timeout=10.0):
+        # Flush-on-shutdown hook: stop batching, push what is left, wait for the writer.
+        # Anything still unsent stays in the journal and is replayed on next start.
+        self._closed.set()
+        self._thread.join(timeout)
+
+    def _next_batch(self, wait=True):
+        batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic() if wait and not self._closed.is_set() else 0
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                if remaining <= 0: break
+        return batch
+
+    def _drop_already_written(self, batch):
+        # Replayed rows may have reached the sheet just before a crash, and a
+        # failed append may have landed anyway; skip any ratingID the worksheet
+        # already holds so replays and retries are idempotent.
+        column = chr(ord("A") + RATING_ID_COLUMN - 1)
+        columns = self.sheets.read_ranges({title: f"'{title}'!{column}:{column}" for title in list(self.sheets.titles)})
+        existing = {row[0] for rows in columns.values() for row in rows if row} & self._unverified_ids
+        self._unverified_ids.clear()
+        if not existing: return batch
+        self.journal.ack(existing)
+        self.rows_deduped += len(existing)
+        self._pending = [row for row in self._pending if row[RATING_ID_COLUMN - 1] not in existing]
+        return [row for row in batch if row[RATING_ID_COLUMN - 1] not in existing]
+
+    def _write(self, batch, max_retries=None):
+        if not batch: return True
+        for attempt in range(max_retries or self.max_retries):
+            try:
+                if self.sheets is None: self.sheets = self.connect()
+                if self._unverified_ids: batch = self._drop_already_written(batch)
+                # One append per partition; each written group leaves the batch
+                # so a retry after a partial failure never re-sends it
+                groups = {}
+                for row in batch: groups.setdefault(self.sheets.title_for(row), []).append(row)
+                for rows in groups.values():
+                    self.sheets.worksheet_for(rows[0]).append_rows(rows, value_input_option='USER_ENTERED')
+                    written = [row[RATING_ID_COLUMN - 1] for row in rows]
+                    self.journal.ack(written)
+                    self.rows_written += len(rows)
+                    batch = [row for row in batch if row[RATING_ID_COLUMN - 1] not in written]
+                return True
+            except Exception as e:
+                self.failed_attempts += 1
+                self.last_error = e
+                # The append may have landed before the error (e.g. a read
+                # timeout), so the next attempt checks the sheet for these IDs first
+                self._unverified_ids.update(row[RATING_ID_COLUMN - 1] for row in batch)
+                # Exponential backoff; cut short if we are shutting down
+                self._closed.wait(min(self.backoff_base * 2 ** attempt, self.backoff_max))
+        self._pending = batch + self._pending
+        return False
+
+    def _run(self):
+        while not self._closed.is_set():
+            self._write(self._next_batch())
+        # Shutdown: drain everything that is left, one attempt per batch
+        while self.backlog():
+            if not self._write(self._next_batch(wait=False), max_retries=1): break
+
+@st.cache_resource
+def get_rating_write_queue():
+    journal = RatingJournal(os.path.join(LOCAL_DATA_DIR, "ratings_journal.jsonl"))
+    write_queue = RatingWriteQueue(connect_to_gsheet, journal, replay=journal.compact())
+    atexit.register(write_queue.close)
+    return write_queue
+
+# --- Ratings Storage Backends ---
+# Both backends take rows in sheet column order and return DataFrames with these columns.
+# ratingVector is the packed per-category ratings (RatingVector.pack) and
+# scoringProfile the ScoringPlan.profile_id that produced "rating".
+RATING_COLUMNS = ["imdbID", "movieTitle", "userName", "rating", "timestamp", "ratingID", "ratingVector", "scoringProfile"]
+# Packed vectors are all hex digits, which Sheets' USER_ENTERED parsing would
+# turn into a number (or scientific notation); the prefix keeps them text.
+RATING_VECTOR_PREFIX = "v1:"
+
+def user_key(user_name):
+    # Duplicate-name checks compare names with full Unicode case folding ("ÉMILE" == "émile").
+    return str(user_name).strip().casefold()
+
+def legacy_rating_id(row):
+    # Rows written before the ratingID column existed get a stable content hash instead.
+    return hashlib.sha1(json.dumps([str(v) for v in row[:5]]).encode()).hexdigest()
+
+class SQLiteRatingStore:
+    # System of record: a local SQLite file in WAL mode (readers never block the
+    # writer). The worksheet, if configured, is only an asynchronous mirror.
+    def __init__(self, path, mirror=None):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.mirror = mirror
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS ratings (ratingID TEXT PRIMARY KEY, imdbID TEXT NOT NULL, movieTitle TEXT, userName TEXT NOT NULL, rating REAL NOT NULL, timestamp TEXT)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_ratings_user ON ratings (userName COLLATE NOCASE)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            columns = {info[1] for info in self._conn.execute("PRAGMA table_info(ratings)")}
+            for column in ("ratingVector", "scoringProfile", "userKey"):
+                if column not in columns: self._conn.execute(f"ALTER TABLE ratings ADD COLUMN {column} TEXT")
+            # userKey = user_key(userName); NOCASE only folds ASCII, so the duplicate check can't use it
+            stale = self._conn.execute("SELECT ratingID, userName FROM ratings WHERE userKey IS NULL").fetchall()
+            self._conn.executemany("UPDATE ratings SET userKey = ? WHERE ratingID = ?", [(user_key(name), rating_id) for rating_id, name in stale])
+            self._conn.execute("DROP INDEX IF EXISTS idx_ratings_imdb_user")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_ratings_imdb_userkey ON ratings (imdbID, userKey)")
+
+    def save(self, row):
+        self.import_rows([row])
+        if self.mirror is not None: self.mirror.enqueue(row)
+
+    def import_rows(self, rows):
+        # Local insert only (no mirroring); ratingID makes re-imports idempotent.
+        # Rows without an imdbID or a numeric rating are skipped; returns how many.
+        records, skipped = [], 0
+        for row in rows:
+            row = (list(row) + [""] * len(RATING_COLUMNS))[:len(RATING_COLUMNS)]
+            try:
+                rating = float(row[3])
+            except (TypeError, ValueError):
+                rating = math.nan
+            if not str(row[0]).strip() or not math.isfinite(rating):
+                skipped += 1
+                continue
+            records.append((row[5] or legacy_rating_id(row), str(row[0]).strip(), row[1], str(row[2]).strip(), user_key(row[2]), rating, row[4], row[6] or None, row[7] or None))
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO ratings (ratingID, imdbID, movieTitle, userName, userKey, rating, timestamp, ratingVector, scoringProfile) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", records)
+        return skipped
+
+    def iter_stale_vectors(self, profile_id, chunk_size):
+        # Keyset-paginated (rowid) stream of (ratingID, ratingVector) scored under
+        # any other profile, so memory stays bounded by chunk_size.
+        last_rowid = 0
+        while True:
+            with self._lock:
+                chunk = self._conn.execute("SELECT rowid, ratingID, ratingVector FROM ratings WHERE rowid > ? AND ratingVector IS NOT NULL AND scoringProfile IS NOT ? ORDER BY rowid LIMIT ?", (last_rowid, profile_id, chunk_size)).fetchall()
+            if not chunk: return
+            last_rowid = chunk[-1][0]
+            yield [(rating_id, packed) for _, rating_id, packed in chunk]
+
+    def update_scores(self, updates):
+        # updates: [(rating, scoringProfile, ratingID)], committed as one transaction
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE ratings SET rating = ?, scoringProfile = ? WHERE ratingID = ?", updates)
+
+    def get_meta(self, key, default=None):
+        with self._lock:
+            found = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return found[0] if found else default
+
+    def set_meta(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return pd.read_sql_query(sql, self._conn, params=params)
+
+    def all_ratings(self):
+        return self._query(f"SELECT {', '.join(RATING_COLUMNS)} FROM ratings")
+
+    def ratings_for_movie(self, imdb_id):
+        return self._query(f"SELECT {', '.join(RATING_COLUMNS)} FROM ratings WHERE imdbID = ?", (str(imdb_id).strip(),))
+
+    def has_rated(self, imdb_id, user_name):
+        with self._lock:
+            found = self._conn.execute("SELECT 1 FROM ratings WHERE imdbID = ? AND userKey = ? LIMIT 1", (str(imdb_id).strip(), user_key(user_name))).fetchone()
+        return found is not None
+
+def ratings_frame(columns):
+    # RATING_COLUMNS-shaped DataFrame with the dtypes every reader expects.
+    ratings = pd.DataFrame(columns, columns=RATING_COLUMNS)
+    ratings["imdbID"] = ratings["imdbID"].astype(str).str.strip()
+    ratings["rating"] = pd.to_numeric(ratings["rating"], errors="coerce")
+    return ratings
+
+class WorksheetReplica:
+    # In-memory, column-oriented copy of every ratings worksheet. `cursors`
+    # holds the last row already copied from each partition; a background timer
+    # range-reads only the rows below them, page by page. Sheets are treated as
+    # append-only: edits or deletions above a cursor are only picked up by resync().
+    # Rows saved by this process are added immediately (read-your-writes) and
+    # skipped by ratingID when the sync later sees them in the sheet. The replica
+    # starts empty and does its first pull on the background thread, so an
+    # unreachable sheet never stops the app from starting or saving.
+    def __init__(self, connect, sync_interval=30.0, page_size=5000):
+        self.connect, self.sync_interval, self.page_size = connect, sync_interval, page_size
+        self.syncs, self.rows_pulled, self.sync_errors, self.last_error, self.last_synced = 0, 0, 0, None, None
+        self.sheets = None
+        self._reset()
+        self._listeners = []
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="worksheet-replica", daemon=True)
+        self._thread.start()
+
+    def _reset(self):
+        self.cursors = {}  # worksheet title -> last synced row (1 = the header row)
+        self._columns = {name: [] for name in RATING_COLUMNS}
+        self._ids = set()
+        self._frame = None
+
+    def _append(self, rows):
+        # Under self._lock. Returns the rows that were new.
+        added = []
+        for row in rows:
+            row = [str(value) for value in (row + [""] * len(RATING_COLUMNS))[:len(RATING_COLUMNS)]]
+            rating_id = row[RATING_ID_COLUMN - 1] or legacy_rating_id(row)
+            if not row[0] or rating_id in self._ids: continue
+            self._ids.add(rating_id)
+            for name, value in zip(RATING_COLUMNS, row): self._columns[name].append(value)
+            added.append(row)
+        if added: self._frame = None
+        return added
+
+    def add_local(self, row):
+        with self._lock: self._append([row])
+
+    def sync(self):
+        # Pulls every row below each partition's cursor; listeners get the ones that
+        # are new. A tick is one metadata request (grid sizes) plus one batched
+        # values request covering the manifest and every partition that can have
+        # rows below its cursor; a partition whose grid ends at its cursor (a
+        # closed month, say) costs nothing. Only full pages need another round.
+        with self._sync_lock:
+            try:
+                if self.sheets is None: self.sheets = self.connect()
+                grid = self.sheets.row_counts()
+                last_column = chr(ord("A") + len(RATING_COLUMNS) - 1)
+                manifest_rows = grid.get(MANIFEST_WORKSHEET, 0)
+                more = True
+                while more:
+                    more, ranges = False, {}
+                    if manifest_rows > 1: ranges[MANIFEST_WORKSHEET] = f"'{MANIFEST_WORKSHEET}'!A2:A{manifest_rows}"
+                    manifest_rows = 0  # once per tick
+                    for title in list(self.sheets.titles):
+                        first = self.cursors.get(title, 1) + 1
+                        last = min(grid.get(title, 0), first + self.page_size - 1)
+                        if first <= last: ranges[title] = f"'{title}'!A{first}:{last_column}{last}"
+                    pages = self.sheets.read_ranges(ranges)
+                    if MANIFEST_WORKSHEET in ranges:
+                        more = bool(self.sheets.add_partitions(row[0] for row in pages.pop(MANIFEST_WORKSHEET) if row))
+                    for title, rows in pages.items():
+                        first = self.cursors.get(title, 1) + 1
+                        with self._lock:
+                            self.cursors[title] = first - 1 + len(rows)
+                            added = self._append(rows)
+                            if added:
+                                delta = ratings_frame(added)
+                                for listener in self._listeners: listener(delta)
+                        self.rows_pulled += len(rows)
+                        if len(rows) == self.page_size: more = True
+            except Exception as e:
+                self.sheets = None  # reconnect next time
+                self.sync_errors += 1
+                self.last_error = e
+                raise
+            self.syncs += 1
+            self.last_synced = time.time()
+
+    def resync(self):
+        with self._sync_lock, self._lock: self._reset()
+        self.sync()
+
+    def frame(self):
+        with self._lock:
+            if self._frame is None: self._frame = ratings_frame(self._columns)
+            return self._frame
+
+    def subscribe(self, listener, initial=None):
+        # listener(ratings) is called with the current frame (or initial(frame)
+        # instead, if given), then with each synced delta, in order (never
+        # concurrently with another delivery).
+        with self._lock:
+            self._listeners.append(listener)
+            (initial or listener)(self.frame())
+
+    def close(self):
+        self._closed.set()
+
+    def _run(self):
+        while True:
+            try:
+                self.sync()
+            except Exception:
+                pass  # counted in sync_errors; the next tick retries
+            if self._closed.wait(self.sync_interval): return
+
+class GSheetRatingStore:
+    # The worksheet is the database. Saves go through the write queue; reads are
+    # served from a WorksheetReplica, so only appends ever wait on Google.
+    def __init__(self, write_queue, replica):
+        self.write_queue, self.replica = write_queue, replica
+
+    def save(self, row):
+        self.write_queue.enqueue(row)
+        self.replica.add_local(row)
+
+    def all_ratings(self):
+        return self.replica.frame()
+
+    def ratings_for_movie(self, imdb_id):
+        ratings = self.all_ratings()
+        return ratings[ratings["imdbID"] == str(imdb_id).strip()]
+
+    def has_rated(self, imdb_id, user_name):
+        return self.ratings_for_movie(imdb_id)["userName"].map(user_key).eq(user_key(user_name)).any()
+
+@st.cache_resource
+def get_rating_store():
+    # RATINGS_BACKEND = "sqlite" (default) or "gsheet"; the sheet is mirrored
+    # whenever Google credentials are configured.
+    if st.secrets.get("RATINGS_BACKEND", "sqlite") == "gsheet":
+        replica = WorksheetReplica(connect_to_gsheet, sync_interval=float(st.secrets.get("SHEET_SYNC_INTERVAL", 30.0)))
+        atexit.register(replica.close)
+        store = GSheetRatingStore(get_rating_write_queue(), replica)
+    else:
+        mirror = get_rating_write_queue() if "gcp_service_account" in st.secrets else None
+        store = SQLiteRatingStore(os.path.join(LOCAL_DATA_DIR, "ratings.db"), mirror=mirror)
+        if mirror is not None and not store.get_meta("seeded_from_sheet"):
+            # One-time import of the history that lived only in the sheet
+            try:
+                rows = [row for _, worksheet in connect_to_gsheet().worksheets() for row in worksheet.get_all_values()[1:]]
+            except Exception:
+                rows = None  # sheet unreachable; try again on the next process start
+            if rows is not None:
+                store.set_meta("seed_skipped_rows", store.import_rows(rows))
+                store.set_meta("seeded_from_sheet", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        plan = get_scoring_plan()
+        start_rescore_job(plan.profile_id, store, plan)
+    suggestions = get_title_suggestions()  # resolved here: the listener runs on the sync thread
+    def suggest_rated_titles(ratings):
+        suggestions.extend((imdb_id, title, "", 0, 1) for imdb_id, title in ratings[["imdbID", "movieTitle"]].itertuples(index=False))
+    try:
+        if hasattr(store, "replica"):
+            store.replica.subscribe(suggest_rated_titles)  # the replica fills in after the first sync
+        else:
+            suggest_rated_titles(store.all_ratings())
+    except Exception:
+        pass  # autocomplete just starts without the rated titles
+    return store
+
+# --- Per-Movie Aggregate Index ---
+# Damped ("Bayesian") averages pull a movie with few ratings towards the mean of
+# all ratings, as if it also had BAYESIAN_PRIOR_WEIGHT ratings at that mean.
+BAYESIAN_PRIOR_WEIGHT = 5
+
+class RunningStats:
+    # Welford's online mean/variance: O(1) per value, numerically stable.
+    def __init__(self):
+        self.count, self.mean, self._m2 = 0, 0.0, 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
 
-def save_rating_to_gsheet(worksheet, imdb_id, movie_title, user_name, rating):
+    def std(self):
+        return math.sqrt(self.variance())
+
+class TDigest:
+    # Merging t-digest (Dunning & Ertl) for streaming quantiles. Values are
+    # buffered and folded into sorted centroids under the k1 scale function, so
+    # memory is O(compression) and an add is amortised O(log n). Until the
+    # first compression every centroid is a single value and quantiles are exact.
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.means, self.weights = [], []
+        self._buffer = []
+        self.count = 0
+        self.min, self.max = math.inf, -math.inf
+
+    def add(self, value):
+        self._buffer.append(value)
+        self.count += 1
+        self.min, self.max = min(self.min, value), max(self.max, value)
+        if len(self._buffer) >= self.compression: self._compress()
+
+    def _q_limit(self, q):
+        # Largest quantile the current centroid may reach: one unit of k1 = δ/2π·asin(2q-1) further on.
+        k = self.compression / (2 * math.pi) * math.asin(max(-1.0, min(1.0, 2 * q - 1))) + 1
+        return 1.0 if k >= self.compression / 4 else (math.sin(2 * math.pi * k / self.compression) + 1) / 2
+
+    def _compress(self):
+        points = sorted(list(zip(self.means, self.weights)) + [(value, 1) for value in self._buffer])
+        self._buffer = []
+        means, weights, done = [points[0][0]], [points[0][1]], 0
+        limit = self._q_limit(0.0)
+        for mean, weight in points[1:]:
+            if (done + weights[-1] + weight) / self.count <= limit:
+                weights[-1] += weight
+                means[-1] += (mean - means[-1]) * weight / weights[-1]
+            else:
+                done += weights[-1]
+                limit = self._q_limit(done / self.count)
+                means.append(mean)
+                weights.append(weight)
+        self.means, self.weights = means, weights
+
+    def quantile(self, q):
+        # Read-only (the buffer is merged into a local view), so it is safe to
+        # call while another thread adds values.
+        centroids = sorted(list(zip(self.means, self.weights)) + [(value, 1) for value in list(self._buffer)])
+        if not centroids: return math.nan
+        if all(weight == 1 for _, weight in centroids):
+            # Still exact: linear interpolation between order statistics, as pandas/NumPy do
+            position = q * (len(centroids) - 1)
+            low = int(position)
+            high = min(low + 1, len(centroids) - 1)
+            return centroids[low][0] + (centroids[high][0] - centroids[low][0]) * (position - low)
+        target, seen = q * sum(weight for _, weight in centroids), 0.0
+        previous_center, previous_mean = 0.0, self.min
+        for mean, weight in centroids:
+            center = seen + weight / 2
+            if target <= center:
+                if center == previous_center: return mean
+                return previous_mean + (mean - previous_mean) * (target - previous_center) / (center - previous_center)
+            previous_center, previous_mean = center, mean
+            seen += weight
+        return previous_mean if seen == previous_center else previous_mean + (self.max - previous_mean) * (target - previous_center) / (seen - previous_center)
+
+class MovieAggregate:
+    # Streaming summary of one movie's ratings: Welford mean/variance, a
+    # t-digest for median/percentiles, and bounded heaps of the best and worst
+    # ratings. Heap keys carry -seq so that, on ties, the earliest rating is
+    # kept (the same tie-break as pandas nlargest/nsmallest with keep="first").
+    def __init__(self):
+        self.title = ""
+        self.stats, self.digest = RunningStats(), TDigest()
+        self.top = []     # min-heap of (rating, -seq, userName): smallest of the best N at [0]
+        self.bottom = []  # min-heap of (-rating, -seq, userName): largest of the worst N at [0]
+
+    @property
+    def count(self):
+        return self.stats.count
+
+    def add(self, user_name, rating, seq, top_n):
+        self.stats.add(rating)
+        self.digest.add(rating)
+        for heap, key in ((self.top, (rating, -seq, user_name)), (self.bottom, (-rating, -seq, user_name))):
+            if len(heap) < top_n: heapq.heappush(heap, key)
+            elif key > heap[0]: heapq.heapreplace(heap, key)
+
+    def mean(self):
+        return self.stats.mean
+
+    def std(self):
+        return self.stats.std()
+
+    def quantile(self, q):
+        return self.digest.quantile(q)
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def bayesian_average(self, prior_mean, prior_weight=BAYESIAN_PRIOR_WEIGHT):
+        return (prior_weight * prior_mean + self.count * self.mean()) / (prior_weight + self.count)
+
+    def top_ratings(self):
+        return [(name, rating) for rating, _, name in sorted(self.top, reverse=True)]
+
+    def bottom_ratings(self):
+        return [(name, -neg_rating) for neg_rating, _, name in sorted(self.bottom, reverse=True)]
+
+class RankedSkipList:
+    # Indexable skip list (links carry how many bottom-level nodes they span):
+    # insert, remove, rank-of-key and key-at-rank are all expected O(log n).
+    # Keys must be unique, mutually comparable tuples.
+    MAX_LEVELS = 24
+    END = (math.inf,)  # sentinel key, compares greater than any (float, ...) tuple
+
+    def __init__(self, seed=0):
+        self._random = random.Random(seed)
+        self._end = [self.END, [], []]
+        self._head = [None, [self._end] * self.MAX_LEVELS, [1] * self.MAX_LEVELS]  # [key, next nodes, link widths]
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def insert(self, key):
+        chain, steps_at_level = [None] * self.MAX_LEVELS, [0] * self.MAX_LEVELS
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node[1][level][0] <= key:
+                steps_at_level[level] += node[2][level]
+                node = node[1][level]
+            chain[level] = node
+        height = min(self.MAX_LEVELS, 1 - int(math.log2(1.0 - self._random.random())))
+        new_node, steps = [key, [None] * height, [None] * height], 0
+        for level in range(height):
+            previous = chain[level]
+            new_node[1][level], previous[1][level] = previous[1][level], new_node
+            new_node[2][level], previous[2][level] = previous[2][level] - steps, steps + 1
+            steps += steps_at_level[level]
+        for level in range(height, self.MAX_LEVELS): chain[level][2][level] += 1
+        self.size += 1
+
+    def remove(self, key):
+        chain = [None] * self.MAX_LEVELS
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node[1][level][0] < key: node = node[1][level]
+            chain[level] = node
+        target = chain[0][1][0]
+        if target[0] != key: raise KeyError(key)
+        for level in range(len(target[1])):
+            previous = chain[level]
+            previous[2][level] += target[2][level] - 1
+            previous[1][level] = target[1][level]
+        for level in range(len(target[1]), self.MAX_LEVELS): chain[level][2][level] -= 1
+        self.size -= 1
+
+    def rank(self, key):
+        # 0-based position key has (or would have) in sorted order.
+        position, node = 0, self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node[1][level][0] < key:
+                position += node[2][level]
+                node = node[1][level]
+        return position
+
+    def slice(self, start, count):
+        # Keys at positions start .. start+count-1: an O(log n) seek, then a walk.
+        if start >= self.size or count <= 0: return []
+        remaining, node = start + 1, self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node[2][level] <= remaining:
+                remaining -= node[2][level]
+                node = node[1][level]
+        keys = []
+        while node is not self._end and len(keys) < count:
+            keys.append(node[0])
+            node = node[1][0]
+        return keys
+
+# The global ranking orders movies by their damped average against a snapshot
+# of the all-movie mean; the snapshot (and so every key) is refreshed once the
+# live mean has drifted more than this from it, keeping single updates O(log n).
+RANKING_PRIOR_DRIFT = 0.05
+
+class MovieAggregateIndex:
+    # imdbID -> MovieAggregate, updated on every save so the leaderboard never
+    # has to scan the ratings table, plus a RankedSkipList of all movies by
+    # weighted score for the global ranking. Rebuilt from storage once per process.
+    def __init__(self, top_n=10):
+        self.top_n = top_n
+        self._movies = {}
+        self._seq = 0
+        self.overall = RunningStats()  # every rating of every movie
+        self.prior = 0.0  # the snapshot of overall.mean that bayesian_average and the ranking use
+        self.ranking, self._rank_keys = RankedSkipList(), {}
+        self._lock = threading.Lock()
+
+    def _add(self, imdb_id, user_name, rating, title):
+        # Caller holds self._lock.
+        self._seq += 1
+        self.overall.add(rating)
+        movie = self._movies.setdefault(imdb_id, MovieAggregate())
+        if title: movie.title = title
+        movie.add(user_name, rating, self._seq, self.top_n)
+        return movie
+
+    def _place(self, imdb_id, movie):
+        old_key = self._rank_keys.get(imdb_id)
+        if old_key is not None: self.ranking.remove(old_key)
+        self._rank_keys[imdb_id] = (-movie.bayesian_average(self.prior), imdb_id)
+        self.ranking.insert(self._rank_keys[imdb_id])
+
+    def _rerank(self):
+        self.prior = self.overall.mean
+        self.ranking, self._rank_keys = RankedSkipList(), {}
+        for imdb_id, movie in self._movies.items(): self._place(imdb_id, movie)
+
+    def add(self, imdb_id, user_name, rating, title=""):
+        imdb_id = str(imdb_id).strip()
+        with self._lock:
+            movie = self._add(imdb_id, user_name, float(rating), title)
+            if abs(self.overall.mean - self.prior) > RANKING_PRIOR_DRIFT: self._rerank()
+            else: self._place(imdb_id, movie)
+
+    def add_ratings(self, ratings):
+        # Bulk load (rebuilds, replica deltas): one re-rank at the end instead of one per row.
+        with self._lock:
+            for imdb_id, title, user_name, rating in ratings[["imdbID", "movieTitle", "userName", "rating"]].itertuples(index=False):
+                if pd.notna(rating): self._add(str(imdb_id).strip(), user_name, float(rating), title)
+            self._rerank()
+
+    def rebuild(self, ratings):
+        with self._lock:
+            self._movies, self._seq, self.overall = {}, 0, RunningStats()
+        self.add_ratings(ratings)
+
+    def get(self, imdb_id):
+        return self._movies.get(str(imdb_id).strip())
+
+    def bayesian_average(self, imdb_id):
+        movie = self.get(imdb_id)
+        return movie.bayesian_average(self.prior) if movie is not None else self.prior
+
+    def ranked_count(self):
+        return len(self.ranking)
+
+    def rank_of(self, imdb_id):
+        # 1-based position in the global ranking, or None if the movie has no ratings.
+        with self._lock:
+            key = self._rank_keys.get(str(imdb_id).strip())
+            return None if key is None else self.ranking.rank(key) + 1
+
+    def ranked(self, start, count):
+        # [(position, imdbID, title, weighted score, ratings)] for positions start+1 .. start+count.
+        with self._lock:
+            return [(start + offset + 1, imdb_id, self._movies[imdb_id].title, -negated_score, self._movies[imdb_id].count)
+                    for offset, (negated_score, imdb_id) in enumerate(self.ranking.slice(start, count))]
+
+@st.cache_resource
+def get_movie_aggregates(_store):
+    index = MovieAggregateIndex()
+    if hasattr(_store, "replica"):
+        _store.replica.subscribe(index.add_ratings)  # also picks up rows other processes append
+    else:
+        index.rebuild(_store.all_ratings())
+    return index
+
+# --- Duplicate-Rater Index ---
+class BloomFilter:
+    # Fixed-size bit array with k probes from one blake2b digest (double hashing).
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(int(capacity), 1)
+        self.size = max(int(-self.capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(int(round(self.size / self.capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, key):
+        for pos in self._positions(key): self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+class RaterIndex:
+    # Process-wide set of normalized (imdbID, user_key(userName)) keys so the
+    # "already rated" check is a hash lookup on every rerun. With bloom=True only
+    # a Bloom filter is kept in memory and its (rare) positives are confirmed
+    # against the store.
+    def __init__(self, store, bloom=False, build=True):
+        self.store, self.bloom = store, bloom
+        self._lock = threading.Lock()
+        if build: self.rebuild()
+
+    @staticmethod
+    def key(imdb_id, user_name):
+        return f"{str(imdb_id).strip()}\x1f{user_key(user_name)}"
+
+    def rebuild(self, ratings=None):
+        if ratings is None: ratings = self.store.all_ratings()
+        keys = {self.key(imdb_id, user_name) for imdb_id, user_name in ratings[["imdbID", "userName"]].itertuples(index=False)}
+        if self.bloom:
+            members = BloomFilter(max(2 * len(keys), 10000))
+            for key in keys: members.add(key)
+        else:
+            members = keys
+        with self._lock:
+            self._members = members
+
+    def add(self, imdb_id, user_name):
+        with self._lock:
+            self._members.add(self.key(imdb_id, user_name))
+        if self.bloom and self._members.count > self._members.capacity: self.rebuild()
+
+    def add_ratings(self, ratings):
+        for imdb_id, user_name in ratings[["imdbID", "userName"]].itertuples(index=False): self.add(imdb_id, user_name)
+
+    def contains(self, imdb_id, user_name):
+        if self.key(imdb_id, user_name) not in self._members: return False
+        return self.store.has_rated(imdb_id, user_name) if self.bloom else True
+
+@st.cache_resource
+def get_rater_index(_store):
+    bloom = bool(st.secrets.get("RATER_INDEX_BLOOM", False))
+    if not hasattr(_store, "replica"): return RaterIndex(_store, bloom=bloom)
+    # Built from the replica's current frame, then kept up to date with its deltas
+    index = RaterIndex(_store, bloom=bloom, build=False)
+    _store.replica.subscribe(index.add_ratings, initial=index.rebuild)
+    return index
+
+def save_rating(store, imdb_id, movie_title, user_name, rating, rating_vector=None, scoring_profile=""):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    new_row = [imdb_id, movie_title, user_name, float(rating), timestamp]
-    worksheet.append_row(new_row, value_input_option='USER_ENTERED')
-
-# --- READING FUNCTIONS (COMMENTED OUT) ---
-# """
-# def get_all_ratings(_worksheet):
-#     return pd.DataFrame(_worksheet.get_all_records())
-
-# def check_if_name_exists(worksheet, imdb_id, user_name):
-#     if user_name.strip() == "": return False
-#     all_ratings_df = get_all_ratings(worksheet)
-#     if all_ratings_df.empty or "imdbID" not in all_ratings_df.columns or "userName" not in all_ratings_df.columns: return False
-#     all_ratings_df['imdbID'] = all_ratings_df['imdbID'].astype(str).str.strip()
-#     movie_ratings = all_ratings_df[all_ratings_df['imdbID'] == str(imdb_id).strip()]
-#     if movie_ratings.empty: return False
-#     return movie_ratings['userName'].str.lower().eq(user_name.lower()).any()
-# """
+    packed = rating_vector.pack() if rating_vector is not None else ""
+    new_row = [imdb_id, movie_title, user_name, float(rating), timestamp, uuid.uuid4().hex, packed, scoring_profile]
+    # Indexes are fetched before the row is stored: one built on first use here
+    # would already read the new row from the store, and .add() would count it twice
+    aggregates = get_movie_aggregates(store)
+    raters = get_rater_index(store)
+    histograms = get_category_histograms(store)
+    store.save(new_row)
+    aggregates.add(imdb_id, user_name, new_row[3], movie_title)
+    raters.add(imdb_id, user_name)
+    get_title_suggestions().add(imdb_id, movie_title, seen=0, rated=1)
+    if packed: histograms.add(imdb_id, packed)
+
+# --- Bulk Re-scoring ---
+HEX_DIGITS = frozenset("0123456789abcdef")
+
+def unpack_rating_vectors(packed_vectors, plan):
+    # Hex nibble strings (RATING_VECTOR_PREFIX optional) -> (N x categories) int
+    # matrix, "no action" mask and a mask of rows that are valid under this plan
+    # (right length, hex digits, in range).
+    width = len(plan.names)
+    packed_vectors = [packed[len(RATING_VECTOR_PREFIX):] if packed.startswith(RATING_VECTOR_PREFIX) else packed for packed in packed_vectors]
+    same_length = np.array([len(packed) == width and set(packed) <= HEX_DIGITS for packed in packed_vectors], dtype=bool)
+    digits = np.frombuffer("".join(p for p, ok in zip(packed_vectors, same_length) if ok).encode("ascii"), dtype=np.uint8).reshape(-1, width)
+    ratings = np.where(digits >= ord("a"), digits - ord("a") + 10, digits - ord("0")).astype(np.int64)
+    unrated = ratings == 0
+    no_action = unrated[:, plan.action_index].copy() if plan.action_index is not None else np.zeros(len(ratings), dtype=bool)
+    if plan.action_index is not None: unrated[:, plan.action_index] = False
+    valid = ~unrated.any(axis=1) & (ratings <= np.array(plan.max_scores)).all(axis=1)
+    full_valid = np.zeros(len(packed_vectors), dtype=bool)
+    full_valid[np.flatnonzero(same_length)[valid]] = True
+    safe = np.where(ratings == 0, 1, ratings)
+    return safe[valid], no_action[valid], full_valid
+
+def rescore_ratings(store, plan, chunk_size=5000):
+    # Streams every stored vector not yet scored under plan.profile_id through
+    # the batch scorer and writes each chunk back before reading the next.
+    # Yields the running number of re-scored ratings. Vectors saved under a
+    # different category layout are left alone.
+    rescored = 0
+    for chunk in store.iter_stale_vectors(plan.profile_id, chunk_size):
+        rating_ids, packed_vectors = zip(*chunk)
+        ratings, no_action, valid = unpack_rating_vectors(packed_vectors, plan)
+        if len(ratings):
+            scores = plan.calculate_scores_batch(ratings, no_action)
+            store.update_scores([(float(score), plan.profile_id, rating_id) for score, rating_id in zip(scores, np.asarray(rating_ids)[valid])])
+            rescored += len(ratings)
+        yield rescored
+
+@st.cache_resource
+def start_rescore_job(profile_id, _store, _plan):
+    # Once per scoring profile (profile_id is the only hashed argument): bring
+    # stored scores up to date in the background, then rebuild the aggregates
+    # that were built from old scores.
+    if not hasattr(_store, "update_scores"): return None
+    def run():
+        rescored = 0
+        for rescored in rescore_ratings(_store, _plan): pass
+        if rescored: get_movie_aggregates(_store).rebuild(_store.all_ratings())
+    job = threading.Thread(target=run, name="rescore-ratings", daemon=True)
+    job.start()
+    return job
+
+# --- Per-Category Histograms ---
+class CategoryHistograms:
+    # Counts per (movie, category, rating value), plus the same across all
+    # movies. Each movie has one flat int64 array shaped from the categories'
+    # max_score: category i owns slots offsets[i] .. offsets[i] + max_score, and
+    # slot 0 of a category counts "no action". Saves add to the counters and
+    # charts read them; raw rows are only scanned when the index is built.
+    # Rows without a vector valid under the current layout are not counted.
+    def __init__(self, plan):
+        self.plan = plan
+        self.offsets = np.concatenate(([0], np.cumsum(np.array(plan.max_scores) + 1)))
+        self.overall = np.zeros(self.offsets[-1], dtype=np.int64)
+        self._movies = {}
+        self._lock = threading.Lock()
+
+    def _slots(self, packed_vectors):
+        ratings, no_action, valid = unpack_rating_vectors(packed_vectors, self.plan)
+        if self.plan.action_index is not None: ratings[no_action, self.plan.action_index] = 0
+        return ratings + self.offsets[:-1], valid
+
+    def add_ratings(self, ratings):
+        slots, valid = self._slots(ratings["ratingVector"].fillna("").astype(str).tolist())
+        if not len(slots): return
+        movie_ids, movie_of_row = np.unique(ratings["imdbID"].astype(str).str.strip().to_numpy()[valid], return_inverse=True)
+        width = len(self.overall)
+        counts = np.bincount((movie_of_row[:, None] * width + slots).ravel(), minlength=len(movie_ids) * width).reshape(len(movie_ids), width)
+        with self._lock:
+            self.overall += counts.sum(axis=0)
+            for imdb_id, movie_counts in zip(movie_ids, counts):
+                if imdb_id in self._movies: self._movies[imdb_id] += movie_counts
+                else: self._movies[imdb_id] = movie_counts
+
+    def add(self, imdb_id, packed_vector):
+        slots, valid = self._slots([packed_vector])
+        if not valid[0]: return
+        with self._lock:
+            movie_counts = self._movies.setdefault(str(imdb_id).strip(), np.zeros_like(self.overall))
+            movie_counts[slots[0]] += 1
+            self.overall[slots[0]] += 1
+
+    def histogram(self, category_index, imdb_id=None):
+        # Counts for rating values 0 (no action) .. max_score of one category,
+        # for one movie or (imdb_id=None) for all of them.
+        counts = self.overall if imdb_id is None else self._movies.get(str(imdb_id).strip())
+        start, end = self.offsets[category_index], self.offsets[category_index + 1]
+        return np.zeros(end - start, dtype=np.int64) if counts is None else counts[start:end].copy()
+
+@st.cache_resource
+def get_category_histograms(_store):
+    histograms = CategoryHistograms(get_scoring_plan())
+    if hasattr(_store, "replica"):
+        _store.replica.subscribe(histograms.add_ratings)  # also picks up rows other processes append
+    else:
+        histograms.add_ratings(_store.all_ratings())
+    return histograms
+
+# --- READING FUNCTIONS ---
+def check_if_name_exists(store, imdb_id, user_name):
+    if user_name.strip() == "": return False
+    return get_rater_index(store).contains(imdb_id, user_name)
 
 # --- Core App Functions ---
+def current_ratings():
+    # One rating per category in CATEGORY_DEFINITIONS order, None for "no action".
+    return session_rating_vector().as_ratings()
+
 def reset_app():
-    keys_to_delete = ["movie_selected", "search_query_input", "search_results", "selected_movie_details", "user_name"]
+    # Only this session's state is dropped; shared caches (OMDb details,
+    # aggregates, rendered descriptors) stay warm for everyone else.
+    keys_to_delete = ["movie_selected", "search_query_input", "search_results", "selected_movie_details", "user_name", "rating_vector"]
     for key in keys_to_delete:
             if key in st.session_state: del st.session_state[key]
-    for category in CATEGORY_DEFINITIONS:
-            st.session_state[f"rating_{category['name']}"] = category['max_score'] // 2 + 1
-            if category["name"] == "Action": st.session_state[f"no_action_{category['name']}"] = False
-    st.cache_data.clear()
+    for spec in get_category_registry():
+            st.session_state[spec.widget_key] = spec.default_rating
+            if spec.allows_no_action: st.session_state[spec.no_action_key] = False
     st.session_state.scroll_to_top = True
 
 if "scroll_to_top" in st.session_state:
@@ -346,6 +1953,91 @@ if "scroll_to_top" in st.session_state:
 # ==============================================================================
 # 2. CORE LOGIC CLASSES
 # ==============================================================================
+class CategorySpec:
+    # Immutable, slot-based view of one CATEGORY_DEFINITIONS entry. One instance
+    # per category is shared by every session (see get_category_registry).
+    __slots__ = ("index", "name", "max_score", "weight", "weight_multipliers", "descriptors", "default_rating", "allows_no_action", "widget_key", "no_action_key")
+
+    def __init__(self, index, cat_def):
+        values = {
+            "index": index,
+            "name": cat_def["name"],
+            "max_score": cat_def["max_score"],
+            "weight": cat_def["weight"],
+            "weight_multipliers": MappingProxyType(dict(cat_def.get("weight_multipliers", {}))),
+            "descriptors": tuple(cat_def["descriptors"]),
+            "default_rating": cat_def["max_score"] // 2 + 1,
+            "allows_no_action": cat_def["name"] == "Action",
+            "widget_key": f"rating_{cat_def['name']}",
+            "no_action_key": f"no_action_{cat_def['name']}",
+        }
+        for attr, value in values.items(): object.__setattr__(self, attr, value)
+
+    def __setattr__(self, attr, value):
+        raise AttributeError("CategorySpec is immutable")
+
+class CategoryRegistry:
+    # Ordered, read-only collection of CategorySpecs (CATEGORY_DEFINITIONS order).
+    __slots__ = ("specs", "by_name")
+
+    def __init__(self, category_definitions):
+        self.specs = tuple(CategorySpec(i, cat_def) for i, cat_def in enumerate(category_definitions))
+        self.by_name = MappingProxyType({spec.name: spec for spec in self.specs})
+
+    def __iter__(self):
+        return iter(self.specs)
+
+    def __len__(self):
+        return len(self.specs)
+
+class RatingVector:
+    # A session's ratings as one int8 slot per category; NO_ACTION marks an
+    # Action category the user skipped. This is what scoring and storage share.
+    __slots__ = ("values",)
+    NO_ACTION = -1
+
+    def __init__(self, values):
+        self.values = array("b", values)
+
+    @classmethod
+    def defaults(cls, registry):
+        return cls(spec.default_rating for spec in registry)
+
+    def get(self, index):
+        value = self.values[index]
+        return None if value == self.NO_ACTION else value
+
+    def set(self, index, rating):
+        self.values[index] = self.NO_ACTION if rating is None else rating
+
+    def as_ratings(self):
+        return [None if value == self.NO_ACTION else value for value in self.values]
+
+    def pack(self):
+        # 4 bits per category as one hex digit each; 0 stands for "no action".
+        return RATING_VECTOR_PREFIX + "".join(format(0 if value == self.NO_ACTION else value, "x") for value in self.values)
+
+@st.cache_resource
+def build_category_registry(definitions_hash, _category_definitions):
+    return CategoryRegistry(_category_definitions)
+
+@st.cache_resource
+def get_category_registry():
+    # CATEGORY_DEFINITIONS is static for the life of the process: hash it (with
+    # the descriptor text) once, not on every fragment rerun.
+    return build_category_registry(category_definitions_hash(CATEGORY_DEFINITIONS, scoring_only=False), CATEGORY_DEFINITIONS)
+
+def session_rating_vector():
+    if "rating_vector" not in st.session_state:
+        st.session_state.rating_vector = RatingVector.defaults(get_category_registry())
+    return st.session_state.rating_vector
+
+# Bump SCORING_ENGINE_VERSION whenever calculate_score's math changes in a way the
+# scoring-profile hash cannot see (it already covers weights, multipliers,
+# bonuses and the sensitivity).
+SCORING_ENGINE_VERSION = 1
+POLARIZATION_SENSITIVITY = 1.7
+
 class Category:
     def __init__(self, name, max_score, weight, user_rating, multipliers):
             self.name, self.max_score, self.base_weight, self.user_rating, self.weight_multipliers = name, max_score, weight, user_rating, multipliers
@@ -386,13 +2078,7 @@ class MovieRater:
         
         # 4. POLARIZATION (Pushes 6.5s to 8s and 4.5s to 3s)
         # This fixes the "everything is a 5" problem
-        import math
-        sensitivity = 1.7 
-        
-        if raw_average > 0.5:
-            stretched = 0.5 + 0.5 * pow((raw_average - 0.5) / 0.5, 1/sensitivity)
-        else:
-            stretched = 0.5 - 0.5 * pow((0.5 - raw_average) / 0.5, 1/sensitivity)
+        stretched = MovieRater.polarize_scalar(raw_average)
         
         # 5. FINAL ASSEMBLY
         # Base score (0-10) + Bonuses from 10-point categories
@@ -402,39 +2088,354 @@ class MovieRater:
         self.final_score = max(0.0, min(10.0, self.final_score))
         
         return self.final_score, self.categories
+
+    @staticmethod
+    def polarize_scalar(raw_average, sensitivity=POLARIZATION_SENSITIVITY):
+        # One score at a time; plain floats are far cheaper than 0-d arrays here.
+        if raw_average > 0.5:
+            return 0.5 + 0.5 * pow((raw_average - 0.5) / 0.5, 1 / sensitivity)
+        return 0.5 - 0.5 * pow((0.5 - raw_average) / 0.5, 1 / sensitivity)
+
+    @staticmethod
+    def polarize(raw_average, sensitivity=POLARIZATION_SENSITIVITY):
+        # Array twin of polarize_scalar for the batch path (np.power and the
+        # libm pow() may differ in the last bit, far below display precision).
+        raw_average = np.asarray(raw_average, dtype=np.float64)
+        upper = 0.5 + 0.5 * np.power(np.maximum(raw_average - 0.5, 0.0) / 0.5, 1 / sensitivity)
+        lower = 0.5 - 0.5 * np.power(np.maximum(0.5 - raw_average, 0.0) / 0.5, 1 / sensitivity)
+        return np.where(raw_average > 0.5, upper, lower)
+
+    @staticmethod
+    def calculate_scores_batch(ratings, no_action, category_definitions=None):
+        # Vectorized twin of calculate_score for re-scoring many stored ratings at once.
+        # ratings: (N x categories) int matrix in CATEGORY_DEFINITIONS order.
+        # no_action: length-N bool mask, True where "This movie has no action." was ticked.
+        return get_scoring_plan(category_definitions).calculate_scores_batch(ratings, no_action)
+
+
+class ScoringPlan:
+    # A CategoryRegistry compiled into per-(category, rating value) lookup tables.
+    # Ratings are discrete (1..max_score), so the weighted numerator, dynamic weight
+    # and bonus of every possible answer are computed once, up front.
+    TEN_POINT_BONUSES = {10: 0.5, 9: 0.1, 2: -0.1, 1: -0.5}
+
+    def __init__(self, registry, profile_id):
+        self.names = [spec.name for spec in registry]
+        self.max_scores = [spec.max_score for spec in registry]
+        self.action_index = next((spec.index for spec in registry if spec.allows_no_action), None)
+        self.profile_id = profile_id
+
+        width = max(self.max_scores, default=0) + 1
+        self.numerators = np.zeros((len(self.names), width))
+        self.weights = np.zeros((len(self.names), width))
+        self.bonuses = np.zeros((len(self.names), width))
+        for i, spec in enumerate(registry):
+            max_score = spec.max_score
+            if max_score <= 1: continue
+            for rating in range(1, max_score + 1):
+                # Same operations, in the same order, as MovieRater.calculate_score
+                dynamic_weight = spec.weight * spec.weight_multipliers.get(rating, 1.0)
+                self.weights[i, rating] = dynamic_weight
+                self.numerators[i, rating] = (rating - 1) / (max_score - 1) * dynamic_weight
+                if max_score == 10:
+                    self.bonuses[i, rating] = self.TEN_POINT_BONUSES.get(rating, 0.0)
+
+        # Plain nested lists index faster than NumPy for the one-movie path
+        self._rows = list(zip(self.numerators.tolist(), self.weights.tolist(), self.bonuses.tolist()))
+
+        # ±1 step tables for the live preview: steps[i][rating] = (down, up), each a
+        # (numerator, weight, bonus) change, or None past the ends of the scale.
+        self.steps = []
+        for (numerators, weights, bonuses), max_score in zip(self._rows, self.max_scores):
+            def step(rating, to):
+                if not 1 <= to <= max_score or max_score <= 1: return None
+                return (numerators[to] - numerators[rating], weights[to] - weights[rating], bonuses[to] - bonuses[rating])
+            self.steps.append([(step(rating, rating - 1), step(rating, rating + 1)) for rating in range(len(numerators))])
+
+    @staticmethod
+    def finish_scalar(total_weighted_score, total_weight_used, bonus_points):
+        # Raw average -> polarization stretch -> bonuses -> clamp, for one score.
+        raw_average = (total_weighted_score / total_weight_used) if total_weight_used > 0 else 0.5
+        return max(0.0, min(10.0, MovieRater.polarize_scalar(raw_average) * 10 + bonus_points))
+
+    @staticmethod
+    def finish(total_weighted_score, total_weight_used, bonus_points):
+        # Same as finish_scalar, element-wise over arrays.
+        total_weight_used = np.asarray(total_weight_used, dtype=np.float64)
+        has_weight = total_weight_used > 0
+        raw_average = np.where(has_weight, total_weighted_score / np.where(has_weight, total_weight_used, 1.0), 0.5)
+        return np.clip(MovieRater.polarize(raw_average) * 10 + bonus_points, 0.0, 10.0)
+
+    def calculate_score(self, ratings):
+        # ratings: one value per category in definition order, None for "no action".
+        # Returns the final score plus (name, rating, dynamic_weight) summary rows.
+        total_weighted_score = 0.0
+        total_weight_used = 0.0
+        bonus_points = 0.0
+        summary = []
+        for name, max_score, (numerators, weights, bonuses), rating in zip(self.names, self.max_scores, self._rows, ratings):
+            if rating is None or max_score <= 1:
+                summary.append((name, rating, None))
+                continue
+            total_weighted_score += numerators[rating]
+            total_weight_used += weights[rating]
+            bonus_points += bonuses[rating]
+            summary.append((name, rating, weights[rating]))
+        return self.finish_scalar(total_weighted_score, total_weight_used, bonus_points), summary
+
+    def calculate_scores_batch(self, ratings, no_action):
+        ratings = np.asarray(ratings, dtype=np.int64)
+        no_action = np.asarray(no_action, dtype=bool)
+        if ratings.ndim != 2 or ratings.shape[1] != len(self.names):
+            raise ValueError(f"Expected an (N x {len(self.names)}) rating matrix, got shape {ratings.shape}.")
+        if no_action.shape != (ratings.shape[0],):
+            raise ValueError(f"Expected a length-{ratings.shape[0]} no-action mask, got shape {no_action.shape}.")
+
+        n = ratings.shape[0]
+        total_weighted_score = np.zeros(n)
+        total_weight_used = np.zeros(n)
+        bonus_points = np.zeros(n)
+
+        # Columns are accumulated in category order so every row sums in exactly
+        # the same order as the scalar loop (bit-identical results).
+        for col, (name, max_score) in enumerate(zip(self.names, self.max_scores)):
+            if max_score <= 1: continue
+            rated = ratings[:, col]
+            used = ~no_action if col == self.action_index else np.ones(n, dtype=bool)
+            if np.any(used & ((rated < 1) | (rated > max_score))):
+                raise ValueError(f"Ratings for '{name}' must be between 1 and {max_score}.")
+            safe = np.where(used, rated, 1)
+            total_weighted_score = np.where(used, total_weighted_score + self.numerators[col, safe], total_weighted_score)
+            total_weight_used = np.where(used, total_weight_used + self.weights[col, safe], total_weight_used)
+            bonus_points = np.where(used, bonus_points + self.bonuses[col, safe], bonus_points)
+
+        return self.finish(total_weighted_score, total_weight_used, bonus_points)
+
+
+class ScorePreview:
+    # Per-session running totals for the live preview. A slider change adjusts the
+    # totals by one table row instead of re-scoring every category, and the ±1
+    # sensitivities are the precomputed step deltas pushed through one vectorized
+    # finish() call (no full recalculation per category).
+    def __init__(self, plan):
+        self.plan = plan
+        self.ratings = [None] * len(plan.names)
+        self.total_weighted_score, self.total_weight_used, self.bonus_points = 0.0, 0.0, 0.0
+
+    def set_rating(self, index, rating):
+        old = self.ratings[index]
+        if old == rating: return
+        numerators, weights, bonuses = self.plan._rows[index]
+        if old is not None:
+            self.total_weighted_score -= numerators[old]
+            self.total_weight_used -= weights[old]
+            self.bonus_points -= bonuses[old]
+        if rating is not None:
+            self.total_weighted_score += numerators[rating]
+            self.total_weight_used += weights[rating]
+            self.bonus_points += bonuses[rating]
+        self.ratings[index] = rating
+
+    def sync(self, ratings):
+        # Normally exactly one category differs between reruns.
+        for index, (old, new) in enumerate(zip(self.ratings, ratings)):
+            if old != new: self.set_rating(index, new)
+
+    def score(self):
+        return self.plan.finish_scalar(self.total_weighted_score, self.total_weight_used, self.bonus_points)
+
+    def sensitivities(self):
+        # [(name, rating, change at -1, change at +1)]; None where a step is impossible.
+        totals = np.array([self.total_weighted_score, self.total_weight_used, self.bonus_points])
+        deltas = np.zeros((len(self.ratings), 2, 3))
+        possible = np.zeros((len(self.ratings), 2), dtype=bool)
+        for index, rating in enumerate(self.ratings):
+            if rating is None: continue
+            for direction, step in enumerate(self.plan.steps[index][rating]):
+                if step is not None: deltas[index, direction], possible[index, direction] = step, True
+        moved = totals + deltas
+        change = self.plan.finish(moved[..., 0], moved[..., 1], moved[..., 2]) - self.score()
+        return [(name, rating, float(change[i, 0]) if possible[i, 0] else None, float(change[i, 1]) if possible[i, 1] else None)
+                for i, (name, rating) in enumerate(zip(self.plan.names, self.ratings))]
+
+def get_score_preview():
+    plan = get_scoring_plan()
+    preview = st.session_state.get("score_preview")
+    if preview is None or preview.plan is not plan:
+        preview = st.session_state.score_preview = ScorePreview(plan)
+    preview.sync(current_ratings())
+    return preview
+
+def category_definitions_hash(category_definitions, scoring_only=True):
+    # scoring_only: just the fields that affect scoring, so descriptor text edits keep the same plan.
+    if scoring_only:
+        inputs = [(cat["name"], cat["max_score"], cat["weight"], sorted(cat.get("weight_multipliers", {}).items())) for cat in category_definitions]
+    else:
+        inputs = [(cat["name"], cat["max_score"], cat["weight"], sorted(cat.get("weight_multipliers", {}).items()), cat["descriptors"]) for cat in category_definitions]
+    return hashlib.sha256(json.dumps(inputs).encode()).hexdigest()
+
+def scoring_profile_id(category_definitions):
+    # Stored next to every score; a rating whose profile differs from the current
+    # plan's was scored with other weights and is picked up by rescore_ratings.
+    inputs = [category_definitions_hash(category_definitions), POLARIZATION_SENSITIVITY, sorted(ScoringPlan.TEN_POINT_BONUSES.items())]
+    return f"v{SCORING_ENGINE_VERSION}-{hashlib.sha256(json.dumps(inputs).encode()).hexdigest()[:12]}"
+
+@st.cache_resource
+def compile_scoring_plan(definitions_hash, _category_definitions):
+    registry = build_category_registry(category_definitions_hash(_category_definitions, scoring_only=False), _category_definitions)
+    return ScoringPlan(registry, scoring_profile_id(_category_definitions))
+
+@st.cache_resource
+def default_scoring_plan():
+    # CATEGORY_DEFINITIONS is static for the life of the process, so its plan is
+    # hashed once here; a no-argument lookup also spares Streamlit hashing a key.
+    return compile_scoring_plan(category_definitions_hash(CATEGORY_DEFINITIONS), CATEGORY_DEFINITIONS)
+
+def get_scoring_plan(category_definitions=None):
+    if category_definitions is None: return default_scoring_plan()
+    return compile_scoring_plan(category_definitions_hash(category_definitions), category_definitions)
 # ==============================================================================
-# 3. HELPER FUNCTION FOR DISPLAYING LEADERBOARD (COMMENTED OUT)
+# 3. HELPER FUNCTIONS FOR DISPLAY
 # ==============================================================================
-# """
-# def display_leaderboard(worksheet, movie_id):
-#     all_ratings_df = get_all_ratings(worksheet)
-#     st.header("⭐ Community Leaderboard")
-#     if all_ratings_df.empty or "imdbID" not in all_ratings_df.columns:
-#         st.info("No ratings have been submitted for this movie yet.")
-#         return
-#     all_ratings_df['imdbID'] = all_ratings_df['imdbID'].astype(str).str.strip()
-#     movie_ratings = all_ratings_df[all_ratings_df['imdbID'] == str(movie_id).strip()].copy()
-#     if movie_ratings.empty:
-#         st.info("No ratings have been submitted for this movie yet.")
-#         return
-#     movie_ratings["rating"] = pd.to_numeric(movie_ratings["rating"])
-#     count = len(movie_ratings)
-#     mean_score = movie_ratings["rating"].mean()
-#     top_10 = movie_ratings.nlargest(10, "rating")[["userName", "rating"]].to_records(index=False).tolist()
-#     bottom_10 = movie_ratings.nsmallest(10, "rating")[["userName", "rating"]].to_records(index=False).tolist()
-#     st.metric(label=f"Average Score (from {count} ratings)", value=f"{mean_score:.1f} / 10.0")
-#     c1, c2 = st.columns(2)
-#     with c1:
-#         st.subheader("Top Ratings"); [st.markdown(f"- **{name}:** {score:.1f}") for name, score in top_10]
-#     with c2:
-#         st.subheader("Lowest Ratings"); [st.markdown(f"- **{name}:** {score:.1f}") for name, score in bottom_10]
-# """
+# Partial reruns: st.fragment (1.37+), st.experimental_fragment (1.33+), else a full rerun
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
+@fragment
+def rating_panel():
+    # Moving a slider reruns only this function (sliders + live preview), not
+    # the movie header, name check, leaderboard or the rest of the script.
+    # Streamlit widgets need their own keys to keep state between reruns; the
+    # session's RatingVector is updated from them and is what everything else reads.
+    vector = session_rating_vector()
+    for spec in get_category_registry():
+            if spec.widget_key not in st.session_state: st.session_state[spec.widget_key] = spec.default_rating
+            if spec.allows_no_action and spec.no_action_key not in st.session_state: st.session_state[spec.no_action_key] = False
+            st.subheader(spec.name)
+            with st.expander("Show Rating Descriptors"):
+                st.markdown("\n".join(f"- {desc}" for desc in spec.descriptors))
+            if spec.allows_no_action and st.checkbox("This movie has no action.", key=spec.no_action_key):
+                vector.set(spec.index, None)
+            else: vector.set(spec.index, st.slider(f"Rate {spec.name}", 1, spec.max_score, key=spec.widget_key))
+    st.divider()
+    preview = get_score_preview()
+    st.metric(label="Live Score Preview", value=f"{preview.score():.1f} / 10.0")
+    with st.expander("How much each category moves your score (±1)"):
+        fmt = lambda change: "—" if change is None else f"{change:+.2f}"
+        st.dataframe(pd.DataFrame([(name, "N/A" if rating is None else str(rating), fmt(down), fmt(up)) for name, rating, down, up in preview.sensitivities()],
+                                  columns=["Category", "Rating", "−1", "+1"]), hide_index=True, use_container_width=True)
+
+def select_movie(imdb_id):
+    # The only details request the search screen makes; rerenders as the rating screen.
+    try:
+        with st.spinner("Loading movie details..."):
+                details = get_details_prefetcher().get(OMDB_API_KEY, imdb_id)
+    except OmdbThrottled:
+        st.warning(OMDB_BUSY_MESSAGE)
+        return
+    if details:
+            st.session_state.selected_movie_details = details
+            st.session_state.movie_selected = True
+            # Clear search results so they don't reappear after rating
+            st.session_state.search_results = []
+            st.rerun()
+
+OMDB_BUSY_MESSAGE = "The movie database is busy right now. Please try again in a few seconds."
+
+def run_search(search_query):
+    if not search_query: return
+    try:
+        st.session_state.search_results = search_titles(OMDB_API_KEY, search_query)
+    except OmdbThrottled:
+        st.session_state.omdb_busy = True  # shown by the search screen after the rerun
+        st.session_state.search_submitted = True
+        return
+    get_details_prefetcher().prefetch(OMDB_API_KEY, [result["imdbID"] for result in st.session_state.search_results if result.get("imdbID")])
+    get_poster_cache().warm([result.get("Poster") for result in st.session_state.search_results])
+    st.session_state.search_submitted = True
+
+def submit_title():
+    # on_change of the title box and on_click of Search: a suggested title opens
+    # straight away, free text goes to search_titles (catalog, then OMDb).
+    value = st.session_state.get("search_query_input")
+    if value and value in get_title_suggestions(): st.session_state.picked_movie = value
+    else: run_search(value)
+
+@fragment
+def search_box():
+    # Typing is filtered in the browser against the locally known titles, so no
+    # keystroke reaches the server; OMDb (or the offline catalog) is only queried
+    # when free text is submitted. Streamlit < 1.45 (no accept_new_options) gets
+    # a plain text box instead.
+    labels = get_title_suggestions().top()
+    try:
+        st.selectbox("Movie Title", list(labels), index=None, format_func=lambda value: labels.get(value, value), key="search_query_input",
+                     placeholder="Start typing a title…", accept_new_options=True, on_change=submit_title)
+    except TypeError:
+        st.text_input("Movie Title", key="search_query_input", on_change=submit_title)
+    st.button("Search", use_container_width=True, on_click=submit_title)
+    # Callbacks cannot rerun the app, and the results are drawn outside the fragment
+    picked = st.session_state.pop("picked_movie", None)
+    if picked: select_movie(picked)
+    if st.session_state.pop("search_submitted", False): st.rerun()
+
+@fragment
+def display_global_ranking(aggregates, page_size=10):
+    # Paging reruns only this fragment; each page is a skip-list seek plus a short walk.
+    st.header("🏅 Global Rankings")
+    total = aggregates.ranked_count()
+    if not total:
+        st.info("No movies have been rated yet.")
+        return
+    pages = (total + page_size - 1) // page_size
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1, key="ranking_page") if pages > 1 else 1
+    rows = [(position, title or imdb_id, round(score, 2), count) for position, imdb_id, title, score, count in aggregates.ranked((page - 1) * page_size, page_size)]
+    st.dataframe(pd.DataFrame(rows, columns=["Rank", "Movie", "Weighted Score", "Ratings"]), hide_index=True, use_container_width=True)
+    st.caption(f"Ranked by weighted score: each movie's average pulled towards the all-movie mean as if it had {BAYESIAN_PRIOR_WEIGHT} extra average ratings.")
+
+def display_leaderboard(aggregates, movie_id):
+    movie_stats = aggregates.get(movie_id)
+    st.header("⭐ Community Leaderboard")
+    if movie_stats is None or movie_stats.count == 0:
+        st.info("No ratings have been submitted for this movie yet.")
+        return
+    st.metric(label=f"Average Score (from {movie_stats.count} ratings)", value=f"{movie_stats.mean():.1f} / 10.0")
+    m1, m2, m3 = st.columns(3)
+    m1.metric(label="Median", value=f"{movie_stats.median():.1f}")
+    m2.metric(label="Middle 50%", value=f"{movie_stats.quantile(0.25):.1f} – {movie_stats.quantile(0.75):.1f}", help=f"25th to 75th percentile; standard deviation {movie_stats.std():.2f}")
+    m3.metric(label="Weighted Score", value=f"{aggregates.bayesian_average(movie_id):.1f}", help=f"Average pulled towards the all-movie mean as if it had {BAYESIAN_PRIOR_WEIGHT} extra average ratings, so a handful of ratings can't dominate.")
+    rank = aggregates.rank_of(movie_id)
+    if rank: st.caption(f"Ranked #{rank} of {aggregates.ranked_count()} rated movies overall.")
+    c1, c2 = st.columns(2)
+    with c1:
+        st.subheader("Top Ratings"); [st.markdown(f"- **{name}:** {score:.1f}") for name, score in movie_stats.top_ratings()]
+    with c2:
+        st.subheader("Lowest Ratings"); [st.markdown(f"- **{name}:** {score:.1f}") for name, score in movie_stats.bottom_ratings()]
+
+@fragment
+def display_category_distributions(histograms, movie_id):
+    # Picking a category reruns only this fragment; the chart is drawn from counters.
+    st.header("📈 Category Distributions")
+    registry = get_category_registry()
+    spec = registry.specs[st.selectbox("Category", range(len(registry.specs)), format_func=lambda index: registry.specs[index].name, key="distribution_category")]
+    movie_counts, all_counts = histograms.histogram(spec.index, movie_id), histograms.histogram(spec.index)
+    if not movie_counts.sum():
+        st.info("No per-category ratings have been saved for this movie yet.")
+        return
+    first = 0 if spec.allows_no_action else 1  # slot 0 only means something for "no action"
+    labels = ["No action" if value == 0 else str(value) for value in range(first, spec.max_score + 1)]
+    shares = pd.DataFrame({"This movie": movie_counts[first:] / movie_counts.sum() * 100, "All movies": all_counts[first:] / max(all_counts.sum(), 1) * 100}, index=pd.Index(labels, name="Rating"))
+    try:
+        st.bar_chart(shares, stack=False, y_label="% of ratings")
+    except TypeError:  # Streamlit < 1.36: no side-by-side bars or axis labels
+        st.bar_chart(shares)
+    st.caption(f"{int(movie_counts.sum())} ratings of this movie vs {int(all_counts.sum())} across all movies.")
 
 # ==============================================================================
 # 4. STREAMLIT APP LAYOUT
 # ==============================================================================
 st.set_page_config(page_title="LENS Movie Rater", page_icon="🎥", layout="centered")
 OMDB_API_KEY = st.secrets.get("OMDB_API_KEY", "")
+LOCAL_DATA_DIR = st.secrets.get("LOCAL_DATA_DIR", ".lens_data")
 
 # --- VIEW 1: SEARCH SCREEN ---
 if not st.session_state.get("movie_selected"):
@@ -445,52 +2446,53 @@ if not st.session_state.get("movie_selected"):
     st.divider()
     st.header("Search for a Movie to Rate 🔎")
 
-    # --- CHANGED: REFACTORED SEARCH LOGIC USING A FORM ---
-    # This prevents the API from being called on every keystroke and makes the
-    # search action deliberate, avoiding caching issues.
-    with st.form(key="search_form"):
-            search_query = st.text_input("Movie Title", key="search_query_input")
-            submit_button = st.form_submit_button(label="Search", use_container_width=True)
+    # Opening the store also loads every rated title into the autocomplete index
+    store = None
+    try:
+            store = get_rating_store()
+    except Exception:
+            pass
+    search_box()
 
-    if submit_button and search_query:
-            with st.spinner("Searching..."):
-                # The search function is now only called ONCE on submit
-                st.session_state.search_results = search_omdb(OMDB_API_KEY, search_query)
+    if st.session_state.pop("omdb_busy", False): st.warning(OMDB_BUSY_MESSAGE)
 
     # Display results if they exist in the session state
-    if st.session_state.get('search_results'):
+    if st.session_state.get('search_results') is not None:
             if not st.session_state.search_results:
                 st.warning("No movies found for that title. Please try again.")
             else:
                 st.subheader("Search Results")
+                get_poster_cache().wait_for_warm([movie_result.get("Poster") for movie_result in st.session_state.search_results])
                 for movie_result in st.session_state.search_results:
                     col1, col2 = st.columns([1, 4])
+                    prefetched = get_details_prefetcher().peek(OMDB_API_KEY, movie_result['imdbID'])
+                    # Catalog hits carry no poster; use the prefetched details' one when it has landed
+                    poster = movie_result.get("Poster", "N/A")
+                    if poster == "N/A" and prefetched: poster = prefetched.get("Poster", "N/A")
                     with col1:
-                            st.image(movie_result.get("Poster") if movie_result.get("Poster") != "N/A" else "https://i.imgur.com/u1T0t5f.png", width=100)
+                            st.image(get_poster_cache().get(poster, "thumb"), width=100)
                     with col2:
                             st.write(f"**{movie_result['Title']}** ({movie_result['Year']})")
-                            if st.button("Select to Rate", key=movie_result['imdbID']):
-                                with st.spinner("Loading movie details..."):
-                                    details = get_movie_details(OMDB_API_KEY, movie_result['imdbID'])
-                                    if details:
-                                            st.session_state.selected_movie_details = details
-                                            st.session_state.movie_selected = True
-                                            # Clear search results so they don't reappear after rating
-                                            st.session_state.search_results = []
-                                            st.rerun()
+                            if prefetched:
+                                st.caption(f"**Director:** {prefetched.get('Director', 'N/A')} — _{prefetched.get('Plot', '')}_")
+                            if st.button("Select to Rate", key=movie_result['imdbID']): select_movie(movie_result['imdbID'])
+
+    if store:
+            st.divider()
+            display_global_ranking(get_movie_aggregates(store))
 
 # --- VIEW 2: MOVIE RATING SCREEN ---
 else:
     movie = st.session_state.selected_movie_details
-    worksheet = None
+    store = None
     try:
-            worksheet = connect_to_gsheet()
+            store = get_rating_store()
     except Exception as e:
-            st.error(f"Could not connect to the database. Error: {e}")
+            st.error(f"Could not open the ratings database. Error: {e}")
 
     # Movie Header
     col1, col2 = st.columns([1, 3])
-    with col1: st.image(movie.get("Poster", "https://i.imgur.com/u1T0t5f.png"))
+    with col1: st.image(get_poster_cache().get(movie.get("Poster"), "header"))
     with col2:
             st.title(movie.get("Title", "N/A"))
             st.subheader(f"({movie.get('Year', 'N/A')})")
@@ -503,44 +2505,28 @@ else:
     # User name input is still present
     user_name = st.text_input("Your Name (for saving your score)", key="user_name").strip()
 
-    # --- NAME CHECK LOGIC (COMMENTED OUT) ---
-    # name_is_taken = False
-    # if user_name and worksheet:
-    #     name_is_taken = check_if_name_exists(worksheet, movie["imdbID"], user_name)
-
-    # Rating Sliders
-    for cat_data in CATEGORY_DEFINITIONS:
-            name, max_score, key = cat_data["name"], cat_data["max_score"], f"rating_{cat_data['name']}"
-            if key not in st.session_state: st.session_state[key] = max_score // 2 + 1
-            if name == "Action" and f"no_action_{name}" not in st.session_state: st.session_state[f"no_action_{name}"] = False
-            st.subheader(name)
-            with st.expander("Show Rating Descriptors"):
-                for desc in cat_data["descriptors"]: st.write(f" - {desc}")
-            if name == "Action":
-                if not st.checkbox("This movie has no action.", key=f"no_action_{name}"):
-                    st.slider(f"Rate {name}", 1, max_score, key=key)
-            else: st.slider(f"Rate {name}", 1, max_score, key=key)
+    # --- NAME CHECK LOGIC ---
+    name_is_taken = False
+    if user_name and store:
+        name_is_taken = check_if_name_exists(store, movie["imdbID"], user_name)
+
+    # Rating Sliders (own fragment, see rating_panel)
+    rating_panel()
     st.divider()
 
     # Calculate Button & Submission Logic
     is_name_missing = not user_name
-    # The button is now only disabled if the name is missing
-    button_disabled = is_name_missing
+    button_disabled = is_name_missing or name_is_taken
 
     if st.button("Calculate & Save Score", type="primary", use_container_width=True, disabled=button_disabled):
-            rated_cats = []
-            for cat_def in CATEGORY_DEFINITIONS:
-                cat_name = cat_def["name"]
-                rating = None if cat_name == "Action" and st.session_state.get(f"no_action_{cat_name}") else st.session_state.get(f"rating_{cat_name}")
-                rated_cats.append(Category(name=cat_name, max_score=cat_def["max_score"], weight=cat_def["weight"], user_rating=rating, multipliers=cat_def.get("weight_multipliers", {})))
-
-            rater = MovieRater(rated_cats)
-            final_score, summary_cats = rater.calculate_score()
+            scoring_plan = get_scoring_plan()
+            final_score, summary_cats = scoring_plan.calculate_score(current_ratings())
 
-            if worksheet:
+            # Saving only touches local disk; the sheet mirror is synced in the background
+            if store:
                 try:
                     with st.spinner("Saving your rating..."):
-                            save_rating_to_gsheet(worksheet, movie["imdbID"], movie["Title"], user_name, final_score)
+                            save_rating(store, movie["imdbID"], movie["Title"], user_name, final_score, session_rating_vector(), scoring_plan.profile_id)
                     st.success("Your rating has been saved to the database!")
                 except Exception as e:
                     st.error(f"Could not save your rating. Error: {e}")
@@ -552,24 +2538,24 @@ else:
             c1, c2 = st.columns(2)
             mid = (len(summary_cats) + 1) // 2
             with c1:
-                for cat in summary_cats[:mid]:
-                    r_disp, w_disp = (str(cat.user_rating), f"({cat.dynamic_weight:.3f})") if cat.user_rating is not None else ("N/A", "")
-                    st.markdown(f"**{cat.name}:** {r_disp} {w_disp}")
+                for cat_name, rating, dynamic_weight in summary_cats[:mid]:
+                    r_disp, w_disp = (str(rating), f"({dynamic_weight:.3f})") if rating is not None else ("N/A", "")
+                    st.markdown(f"**{cat_name}:** {r_disp} {w_disp}")
             with c2:
-                for cat in summary_cats[mid:]:
-                    r_disp, w_disp = (str(cat.user_rating), f"({cat.dynamic_weight:.3f})") if cat.user_rating is not None else ("N/A", "")
-                    st.markdown(f"**{cat.name}:** {r_disp} {w_disp}")
+                for cat_name, rating, dynamic_weight in summary_cats[mid:]:
+                    r_disp, w_disp = (str(rating), f"({dynamic_weight:.3f})") if rating is not None else ("N/A", "")
+                    st.markdown(f"**{cat_name}:** {r_disp} {w_disp}")
 
             st.divider()
-            # --- LEADERBOARD DISPLAY (COMMENTED OUT) ---
-            # if worksheet:
-            #     display_leaderboard(worksheet, movie["imdbID"])
+            # --- LEADERBOARD DISPLAY ---
+            if store:
+                display_leaderboard(get_movie_aggregates(store), movie["imdbID"])
+                display_category_distributions(get_category_histograms(store), movie["imdbID"])
 
             st.button("Rate a Different Movie", on_click=reset_app, use_container_width=True)
 
-    # Only show the name missing warning
     if is_name_missing:
             st.warning("Please enter your name to enable the save button.")
-    # --- NAME CHECK ERROR (COMMENTED OUT) ---
-    # if name_is_taken:
-    #     st.error(f"The name '{user_name}' has already rated this movie.")
+    # --- NAME CHECK ERROR ---
+    if name_is_taken:
+        st.error(f"The name '{user_name}' has already rated this movie.")